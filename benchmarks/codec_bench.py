@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+#
+# pl3 codec micro-benchmarks.
+#
+# runs under CPython and the MicroPython unix port:
+#   python3 benchmarks/codec_bench.py [results.json] [--baseline old_results.json]
+#   micropython benchmarks/codec_bench.py [results.json] [--baseline old_results.json]
+#
+# reports frames/sec, bytes/sec and bytes allocated per frame for each case.  on MicroPython allocation is
+# gc.mem_alloc() growth with the collector off.  CPython has no cumulative allocation counter, so each sample
+# frame is run on its own and the tracemalloc peaks of those runs, less the peak of a run with no frames, are
+# summed.
+# results are written as JSON so releases can be compared; --baseline prints the change against an older run.
+#
+import gc
+import json
+import sys
+
+_here = __file__.replace('\\', '/').rsplit('/', 1)[0] if '/' in __file__.replace('\\', '/') else '.'
+sys.path.append(_here + '/../src/prolaser3')
+import pl3  # noqa: E402
+
+upython = sys.implementation.name == 'micropython'
+
+if upython:
+    import time
+
+    def ticks_us():
+        return time.ticks_us()
+
+    def elapsed_us(start):
+        return time.ticks_diff(time.ticks_us(), start)
+else:
+    import time
+    import tracemalloc
+
+    def ticks_us():
+        return time.perf_counter()
+
+    def elapsed_us(start):
+        return (time.perf_counter() - start) * 1000000.0
+
+FRAMES = 2000 if upython else 20000
+RANGE_STEP = 7
+USAGE = 'usage: codec_bench.py [results.json] [--baseline old_results.json]'
+
+
+class NullPort:
+    def write(self, buffer):
+        pass
+
+
+def reading_payload(i):
+    rng = (i * RANGE_STEP) & 0xffff
+    return [pl3.CMD_READING, 0x00, i & 0x7f, 0x00, rng & 0xff, rng >> 8, pl3.READING_OK]
+
+
+def make_frames(kind, count):
+    """
+    synthetic frames: 'reading' is a realistic CMD_READING stream, 'escapes' is worst case escape density,
+    'long' is the ~260 byte responses to the CMD_UNK_xx commands.
+    """
+    frames = []
+    for i in range(count):
+        if kind == 'reading':
+            payload = reading_payload(i)
+        elif kind == 'escapes':
+            payload = [pl3.CMD_READING] + [pl3.MESSAGE_ESCAPE if (i + j) & 1 else pl3.END_OF_MESSAGE
+                                           for j in range(6)]
+        elif kind == 'long':
+            payload = [pl3.CMD_UNK_00] + [(i + j) & 0xff for j in range(254)]
+        else:
+            raise ValueError(kind)
+        frames.append(bytes(pl3._build_message(payload)))
+    return frames
+
+
+def traced_peak(fn, frames):
+    """
+    bytes fn(frames) had allocated at its peak, over what was allocated before.
+    """
+    before = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    fn(frames)
+    return tracemalloc.get_traced_memory()[1] - before
+
+
+def alloc_per_frame(fn, sample):
+    """
+    bytes allocated per frame by fn over sample.
+    """
+    if upython:
+        gc.collect()
+        gc.disable()
+        start = gc.mem_alloc()
+        fn(sample)
+        allocated = gc.mem_alloc() - start
+        gc.enable()
+        return allocated / len(sample)
+    singles = [sample[i:i + 1] for i in range(len(sample))]
+    tracemalloc.start()
+    overhead = traced_peak(fn, [])
+    allocated = 0
+    for single in singles:
+        allocated += max(0, traced_peak(fn, single) - overhead)
+    tracemalloc.stop()
+    return allocated / len(sample)
+
+
+def run(name, fn, frames, frame_bytes):
+    """
+    time fn() over all frames, then measure its allocations over a smaller run.
+    fn(frames) must process every frame and return the number of frames processed.
+    """
+    gc.collect()
+    start = ticks_us()
+    processed = fn(frames)
+    us = elapsed_us(start)
+    if processed != len(frames):
+        print('{}: processed {} of {} frames!'.format(name, processed, len(frames)))
+    sample = frames[:100]
+    fn(sample)  # warm up any lazily allocated buffers
+    allocated = alloc_per_frame(fn, sample)
+    seconds = us / 1000000.0
+    result = {
+        'name': name,
+        'frames': len(frames),
+        'seconds': seconds,
+        'frames_per_sec': len(frames) / seconds if seconds > 0 else 0,
+        'bytes_per_sec': frame_bytes / seconds if seconds > 0 else 0,
+        'alloc_bytes_per_frame': allocated,
+    }
+    print('{:28s} {:10.0f} frames/s {:12.0f} bytes/s {:8.1f} alloc bytes/frame'.format(
+        name, result['frames_per_sec'], result['bytes_per_sec'], result['alloc_bytes_per_frame']))
+    return result
+
+
+def bench_build_into(frames):
+    dst = bytearray(pl3.MAX_MESSAGE_LENGTH)
+    for i in range(len(frames)):
+        pl3.build_into(dst, frames[i])
+    return len(frames)
+
+
+def bench_build_message(frames):
+    for i in range(len(frames)):
+        pl3._build_message(frames[i])
+    return len(frames)
+
+
+def bench_write_ee(frames):
+    port = NullPort()
+    for i in range(len(frames)):
+        pl3.write_ee(port, i % pl3.EEPROM_LENGTH, i & 0xff)
+    return len(frames)
+
+
+def bench_validate(frames):
+    count = 0
+    for frame in frames:
+        if pl3.validate_checksum('rx', frame) is not None:
+            count += 1
+    return count
+
+
+def bench_process_rx_buffer(frames):
+    count = 0
+    for frame in frames:
+        cmd, result = pl3.process_rx_buffer(frame, verbosity=0)
+        if cmd is not None:
+            count += 1
+    return count
+
+
+def bench_decoder(chunk_size):
+    def bench(frames):
+        stream = b''.join(frames)
+        decoder = pl3.FrameDecoder()
+        mv = memoryview(stream)
+        count = 0
+        for pos in range(0, len(stream), chunk_size):
+            chunk = mv[pos:pos + chunk_size]
+            for frame in decoder.feed(chunk, len(chunk)):
+                count += 1
+        return count
+    return bench
+
+
+def bench_decode_and_process(frames):
+    stream = b''.join(frames)
+    decoder = pl3.FrameDecoder()
+    mv = memoryview(stream)
+    count = 0
+    for pos in range(0, len(stream), 32):
+        chunk = mv[pos:pos + 32]
+        for frame in decoder.feed(chunk, len(chunk)):
+            pl3.process_rx_frame(frame, verbosity=0)
+            count += 1
+    return count
+
+
+def compare(results, baseline_file):
+    with open(baseline_file, 'r') as f:
+        baseline = json.load(f)
+    old = {}
+    for result in baseline['results']:
+        old[result['name']] = result
+    print()
+    print('change vs {} ({} {})'.format(baseline_file, baseline['implementation'], baseline['version']))
+    for result in results:
+        before = old.get(result['name'])
+        if before is None or before['frames_per_sec'] == 0:
+            continue
+        change = (result['frames_per_sec'] - before['frames_per_sec']) * 100.0 / before['frames_per_sec']
+        print('{:28s} {:+7.1f}%{}'.format(result['name'], change, '  <-- slower' if change < -10.0 else ''))
+
+
+def main():
+    output_file = None
+    baseline_file = None
+    args = sys.argv[1:]
+    while len(args) > 0:
+        arg = args.pop(0)
+        if arg == '--baseline' and len(args) > 0:
+            baseline_file = args.pop(0)
+        elif arg in ('-h', '--help'):
+            print(USAGE)
+            return
+        elif arg.startswith('-') or output_file is not None:
+            print(USAGE)
+            sys.exit(2)
+        else:
+            output_file = arg
+
+    pl3.log_level = pl3.LOG_NONE
+    payloads = [reading_payload(i) for i in range(FRAMES)]
+    escape_payloads = [[pl3.CMD_READING, 0x10, 0x03, 0x10, 0x03, 0x10, 0x03]] * FRAMES
+    readings = make_frames('reading', FRAMES)
+    escapes = make_frames('escapes', FRAMES)
+    longs = make_frames('long', FRAMES // 10)
+
+    def size(frames):
+        return sum([len(f) for f in frames])
+
+    results = [
+        run('build_into reading', bench_build_into, payloads, size(readings)),
+        run('build_into escapes', bench_build_into, escape_payloads, size(escapes)),
+        run('_build_message reading', bench_build_message, payloads, size(readings)),
+        run('write_ee', bench_write_ee, payloads, 8 * len(payloads)),
+        run('validate_checksum reading', bench_validate, readings, size(readings)),
+        run('validate_checksum escapes', bench_validate, escapes, size(escapes)),
+        run('validate_checksum long', bench_validate, longs, size(longs)),
+        run('process_rx_buffer reading', bench_process_rx_buffer, readings, size(readings)),
+        run('FrameDecoder reading/32', bench_decoder(32), readings, size(readings)),
+        run('FrameDecoder reading/1', bench_decoder(1), readings[:FRAMES // 10], size(readings[:FRAMES // 10])),
+        run('FrameDecoder escapes/32', bench_decoder(32), escapes, size(escapes)),
+        run('FrameDecoder long/256', bench_decoder(256), longs, size(longs)),
+        run('decode+process reading/32', bench_decode_and_process, readings, size(readings)),
+    ]
+
+    report = {
+        'implementation': sys.implementation.name,
+        'version': '.'.join([str(v) for v in sys.implementation.version[:3]]),
+        'platform': sys.platform,
+        'results': results,
+    }
+    if output_file is not None:
+        with open(output_file, 'w') as f:
+            f.write(json.dumps(report))
+        print('results written to {}'.format(output_file))
+    if baseline_file is not None:
+        compare(results, baseline_file)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+#
+# bulk decoder for raw Prolaser III serial captures.
+# finds every CMD_READING in a capture file with numpy instead of one frame at a time.
+# desktop python only, requires numpy.
+#
+import argparse
+import sys
+
+import numpy as np
+
+import pl3
+
+BLOCK_SIZE = 4 * 1024 * 1024  # bytes of capture processed per pass, offsets within a block are int32
+
+READING_DTYPE = np.dtype([
+    ('offset', '<i8'),  # file offset of the START_OF_MESSAGE byte
+    ('speed', 'u1'),
+    ('range', '<u2'),  # feet * 10
+    ('status', 'u1'),
+])
+
+
+def load_capture(filename):
+    return np.memmap(filename, dtype=np.uint8, mode='r')
+
+
+def _positions(mask):
+    """
+    offsets of the True elements of mask, as int32.
+    """
+    return np.flatnonzero(mask).astype(np.int32)
+
+
+def _find_frames(data):
+    """
+    find the frames in data, an array of raw captured bytes.
+    frames are found exactly the way pl3.FrameDecoder finds them.
+    returns raw start and end offsets of each frame, the offsets of the escape bytes dropped by unescaping,
+    and the offset after the last END_OF_MESSAGE seen.
+    only the escape, start and end byte offsets are kept, so memory use follows the number of frames,
+    not the size of the block.
+    """
+    n = len(data)
+    esc = _positions(data == pl3.MESSAGE_ESCAPE)
+    # in a run of escape bytes the 1st, 3rd, ... escape the byte after them and are dropped.
+    run_index = np.arange(len(esc), dtype=np.int32)
+    run_start = np.ones(len(esc), dtype=bool)
+    run_start[1:] = esc[1:] != esc[:-1] + 1
+    in_run = run_index - np.maximum.accumulate(np.where(run_start, run_index, 0))
+    dropped = esc[(in_run & 1) == 0]
+    del esc, run_index, run_start, in_run
+
+    ends = _positions(data == pl3.END_OF_MESSAGE)
+    ends = ends[~np.isin(ends, dropped + 1)]  # escaped END_OF_MESSAGE bytes are data
+    if len(ends) == 0:
+        return ends, ends, dropped, 0
+    stx = _positions(data == pl3.START_OF_MESSAGE)
+    # each frame starts at the first START_OF_MESSAGE after the previous END_OF_MESSAGE.
+    previous = np.empty_like(ends)
+    previous[0] = -1
+    previous[1:] = ends[:-1]
+    first = np.searchsorted(stx, previous + 1)
+    has_start = first < len(stx)
+    starts = np.full_like(ends, n)
+    starts[has_start] = stx[first[has_start]]
+    framed = starts < ends
+    return starts[framed], ends[framed], dropped, int(ends[-1]) + 1
+
+
+def _decode_block(data, base):
+    starts, ends, dropped, consumed = _find_frames(data)
+    if len(starts) == 0:
+        return np.zeros(0, dtype=READING_DTYPE), consumed
+
+    def kept_before(raw):
+        # number of unescaped bytes before raw offsets
+        return raw - np.searchsorted(dropped, raw).astype(np.int32)
+
+    kept_before_dropped = dropped - np.arange(len(dropped), dtype=np.int32)
+
+    def raw_offset(unescaped):
+        # raw offsets of unescaped byte numbers
+        return unescaped + np.searchsorted(kept_before_dropped, unescaped, side='right').astype(np.int32)
+
+    first_kept = kept_before(starts)
+    lengths = kept_before(ends + 1) - first_kept  # unescaped frame lengths
+    good = lengths >= 5
+    starts = starts[good]
+    first_kept = first_kept[good]
+    lengths = lengths[good]
+
+    # checksum is the sum of the unescaped bytes after START_OF_MESSAGE up to the checksum byte.
+    # sums are only needed mod 256, so a uint8 running sum is enough.  dropped bytes are all MESSAGE_ESCAPE.
+    sums = np.zeros(len(data) + 1, dtype=np.uint8)
+    np.cumsum(data, dtype=np.uint8, out=sums[1:])
+    checksum_at = raw_offset(first_kept + lengths - 2)
+    dropped_between = np.searchsorted(dropped, checksum_at) - np.searchsorted(dropped, starts + 1)
+    checksums = sums[checksum_at].astype(np.int32) - sums[starts + 1] - pl3.MESSAGE_ESCAPE * dropped_between
+    checksums &= 0xff
+    del sums
+    good = checksums == data[checksum_at]
+
+    # shorter frames are not readings, pl3.decode_reading() returns None for them.
+    readings = good & (lengths >= pl3.READING_LENGTH)
+    readings[readings] = data[raw_offset(first_kept[readings] + 2)] == pl3.CMD_READING
+    first_kept = first_kept[readings]
+
+    def frame_byte(i):
+        return data[raw_offset(first_kept + i)]
+
+    result = np.zeros(len(first_kept), dtype=READING_DTYPE)
+    result['offset'] = starts[readings].astype(np.int64) + base
+    speed = frame_byte(4)
+    result['speed'] = np.where(speed == 0xff, 0, speed)
+    result['range'] = frame_byte(6).astype(np.uint16) + 256 * frame_byte(7).astype(np.uint16)
+    result['status'] = frame_byte(8)
+    return result, consumed
+
+
+def decode_readings(data, block_size=BLOCK_SIZE):
+    """
+    decode all the CMD_READING frames in data, a raw capture as a numpy uint8 array (see load_capture()).
+    returns a READING_DTYPE structured array.
+    """
+    results = []
+    pos = 0
+    n = len(data)
+    while pos < n:
+        block = np.asarray(data[pos:pos + block_size])
+        readings, consumed = _decode_block(block, pos)
+        results.append(readings)
+        if pos + len(block) >= n:
+            break
+        if consumed == 0:
+            # a block with no END_OF_MESSAGE at all; FrameDecoder would have overflowed and thrown it away too.
+            consumed = len(block)
+        pos += consumed
+    if len(results) == 0:
+        return np.zeros(0, dtype=READING_DTYPE)
+    return np.concatenate(results)
+
+
+def cross_check(data, readings, chunk_size=4096):
+    """
+    decode data again with pl3.FrameDecoder and pl3.process_rx_frame and compare with readings.
+    returns a list of mismatch descriptions, empty when both agree.
+    """
+    log_level = pl3.log_level
+    pl3.log_level = pl3.LOG_NONE
+    expected = []
+    try:
+        decoder = pl3.FrameDecoder()
+        for pos in range(0, len(data), chunk_size):
+            chunk = bytes(data[pos:pos + chunk_size])
+            for frame in decoder.feed(chunk):
+                if frame[2] != pl3.CMD_READING:
+                    continue
+                cmd, reading = pl3.process_rx_frame(frame, verbosity=0)
+                if reading is not None:  # None for frames too short to be a reading
+                    expected.append((reading.speed, reading.range, reading.status))
+    finally:
+        pl3.log_level = log_level
+
+    problems = []
+    if len(expected) != len(readings):
+        problems.append('FrameDecoder found {} readings, bulk found {}'.format(len(expected), len(readings)))
+    for i, (want, got) in enumerate(zip(expected, readings)):
+        got = (int(got['speed']), int(got['range']), int(got['status']))
+        if want != got:
+            problems.append('reading {} at offset {:x}: expected {}, got {}'.format(i, int(readings[i]['offset']),
+                                                                                  want, got))
+            if len(problems) > 20:
+                break
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='bulk decode Prolaser III serial captures')
+    parser.add_argument('capture', help='raw capture file')
+    parser.add_argument('--csv', help='write readings to this csv file')
+    parser.add_argument('--cross-check', action='store_true',
+                        help='verify the results against pl3.FrameDecoder (slow)')
+    args = parser.parse_args()
+
+    data = load_capture(args.capture)
+    readings = decode_readings(data)
+    good = np.count_nonzero(readings['status'] == pl3.READING_OK)
+    print('{} bytes, {} readings, {} good'.format(len(data), len(readings), good))
+
+    if args.csv:
+        with open(args.csv, 'w') as csv_file:
+            csv_file.write('offset,speed,range_feet,status\n')
+            for r in readings:
+                csv_file.write('{},{},{:.1f},{}\n'.format(r['offset'], r['speed'], r['range'] / 10.0, r['status']))
+
+    if args.cross_check:
+        problems = cross_check(data, readings)
+        for problem in problems:
+            print(problem)
+        if len(problems) > 0:
+            sys.exit(1)
+        print('cross check ok')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+#
+# Prolaser III simulator.
+# emulates the device side of the serial protocol so the tools can be run and load tested without a gun.
+#
+# use SimulatedSerialPort in place of SerialPort, or run this file to serve the simulator on a pty:
+#   python3 pl3sim.py --rate 100
+#   PL3_SERIAL_PORT=/dev/pts/N python3 prolaser-test.py
+#
+import argparse
+import os
+import select
+import sys
+import time
+
+import pl3
+
+INIT_TEXT = b'PROLASER III SIMULATOR  ' * 6
+TARGET_SPEED = 35  # mph
+TARGET_START_RANGE = 15000  # feet * 10
+TARGET_END_RANGE = 300  # feet * 10
+
+
+class ProLaserSimulator:
+    """
+    the device end of the protocol.  feed it what the host sends with receive(), collect replies with take().
+    while the laser is on, CMD_READING messages are generated at rate readings per second.
+    """
+
+    def __init__(self, eeprom=None, rate=4.0, verbosity=0):
+        self.eeprom = bytearray(eeprom if eeprom is not None else pl3.get_eeprom_data())
+        self.rate = rate
+        self.verbosity = verbosity
+        self.remote = False
+        self.laser = False
+        self.mode = self.eeprom[0xa6]
+        self.baudrate = self._eeprom_baudrate()
+        self.readings_sent = 0
+        self.output = bytearray()
+        self.decoder = pl3.FrameDecoder(name='sim')
+        self._next_reading = 0.0
+        self._range = TARGET_START_RANGE
+
+    def receive(self, data, n=None):
+        for frame in self.decoder.feed(data, n):
+            self._handle(frame)
+
+    def take(self, size=None):
+        """
+        returns up to size bytes of device output.
+        """
+        self.pump()
+        if size is None or size >= len(self.output):
+            result = bytes(self.output)
+            self.output = bytearray()
+        else:
+            result = bytes(self.output[:size])
+            self.output = self.output[size:]
+        return result
+
+    def pump(self, now=None):
+        """
+        generate any readings that are due.
+        """
+        if not self.laser:
+            return
+        if now is None:
+            now = time.monotonic()
+        while self._next_reading <= now:
+            self._send_reading()
+            self._next_reading += 1.0 / self.rate
+            if self._next_reading < now - 1.0:
+                self._next_reading = now  # fell way behind, do not flood.
+
+    def seconds_to_next_reading(self):
+        if not self.laser:
+            return None
+        return max(0.0, self._next_reading - time.monotonic())
+
+    def _eeprom_baudrate(self):
+        return (self.eeprom[0x20] << 8) | self.eeprom[0x21]
+
+    def _respond(self, payload):
+        self.output += pl3._build_message(payload)
+
+    def _send_reading(self):
+        self._range -= TARGET_SPEED * 14.7 / self.rate  # 1 mph is 1.47 feet/sec, range is feet * 10
+        if self._range < TARGET_END_RANGE:
+            self._range = TARGET_START_RANGE
+        rng = int(self._range)
+        speed = TARGET_SPEED if self.mode == pl3.MODE_SPEED else 0xff
+        self._respond([pl3.CMD_READING, 0x00, speed, 0x00, rng & 0xff, rng >> 8, pl3.READING_OK])
+        self.readings_sent += 1
+
+    def _handle(self, frame):
+        command = frame[2]
+        if self.verbosity > 4:
+            print('sim rx {}'.format(pl3.buffer_to_hexes(frame)))
+        if command == pl3.CMD_ENABLE_REMOTE:
+            self.remote = True
+            self._respond([pl3.CMD_ENABLE_REMOTE])
+        elif command == pl3.CMD_EXIT_REMOTE:
+            self.remote = False
+            self._respond([pl3.CMD_EXIT_REMOTE])
+        elif command == pl3.CMD_SET_MODE:
+            self.mode = frame[3]
+            self._respond([pl3.CMD_SET_MODE, self.mode])
+        elif command == pl3.CMD_READ_EEPROM:
+            addr = frame[3]
+            data = self.eeprom[addr] if addr < len(self.eeprom) else 0xff
+            self._respond([pl3.CMD_READ_EEPROM, 0x00, addr, data])
+        elif command == pl3.CMD_WRITE_EEPROM:
+            if frame[3] == 0x80:
+                addr = frame[4]
+                if addr < len(self.eeprom):
+                    self.eeprom[addr] = frame[5]
+                self._respond([pl3.CMD_WRITE_EEPROM, 0x00, addr, 0x00])
+        elif command == pl3.CMD_TOGGLE_LASER:
+            self.laser = not self.laser
+            if self.laser:
+                self._next_reading = time.monotonic()
+            else:
+                self._respond([pl3.CMD_TOGGLE_LASER])
+        elif command in (pl3.CMD_RESET, pl3.CMD_WHO_ARE_YOU):
+            self.laser = False
+            self.remote = False
+            self.mode = self.eeprom[0xa6]
+            self.baudrate = self._eeprom_baudrate()  # the new rate takes effect after reset
+            self._respond([pl3.CMD_INIT_SPD23, 0x01] + list(INIT_TEXT))
+
+
+class SimulatedSerialPort:
+    """
+    drop-in replacement for serialport.SerialPort, talking to a ProLaserSimulator.
+    reads wait up to timeout seconds for data, like pyserial does.
+    nothing gets through unless baudrate matches the simulator's.
+    """
+
+    def __init__(self, name='sim', baudrate=19200, timeout=0.040, rxbuf=None, simulator=None):
+        self.name = name
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.simulator = simulator if simulator is not None else ProLaserSimulator()
+
+    def close(self):
+        pass
+
+    def set_baudrate(self, baudrate):
+        self.baudrate = baudrate
+
+    def write(self, buffer):
+        if self.baudrate == self.simulator.baudrate:
+            self.simulator.receive(buffer)
+
+    def _wait(self):
+        if self.timeout <= 0 or len(self.simulator.output) > 0:
+            return
+        wait = self.simulator.seconds_to_next_reading()
+        if wait is None or wait > self.timeout:
+            wait = self.timeout
+        time.sleep(wait)
+
+    def read(self, size=16):
+        data = self.simulator.take(size)
+        if len(data) == 0:
+            self._wait()
+            data = self.simulator.take(size)
+        if self.baudrate != self.simulator.baudrate:
+            return b''
+        return data
+
+    def readinto(self, buf):
+        data = self.read(len(buf))
+        buf[:len(data)] = data
+        return len(data)
+
+    async def read_into_async(self, buf):
+        import asyncio
+        while len(self.simulator.output) == 0:
+            self.simulator.pump()
+            if len(self.simulator.output) > 0:
+                break
+            wait = self.simulator.seconds_to_next_reading()
+            if wait is None or wait > 0.040:
+                wait = 0.040
+            await asyncio.sleep(wait)
+        data = self.simulator.take(len(buf))
+        if self.baudrate != self.simulator.baudrate:
+            return 0
+        buf[:len(data)] = data
+        return len(data)
+
+
+def serve_pty(simulator):
+    """
+    run the simulator on a pseudo-terminal until interrupted.
+    """
+    import pty
+    import tty
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    print('simulator listening on {}'.format(os.ttyname(slave)))
+    sys.stdout.flush()
+    buf = bytearray(256)
+    while True:
+        wait = simulator.seconds_to_next_reading()
+        readable, _, _ = select.select([master], [], [], 1.0 if wait is None else wait)
+        if readable:
+            n = os.readv(master, [buf])
+            simulator.receive(buf, n)
+        data = simulator.take()
+        if len(data) > 0:
+            os.write(master, data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prolaser III simulator')
+    parser.add_argument('--rate', type=float, default=4.0, help='readings per second while the laser is on')
+    parser.add_argument('--verbosity', type=int, default=0)
+    args = parser.parse_args()
+    simulator = ProLaserSimulator(rate=args.rate, verbosity=args.verbosity)
+    try:
+        serve_pty(simulator)
+    except KeyboardInterrupt:
+        print('{} readings sent'.format(simulator.readings_sent))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,53 +2,136 @@
 #
 # write Prolaser III EEPROM data
 #
-
-import time
+# by default the current EEPROM is read first and only the bytes that differ from the target, plus the checksum,
+# are written and then read back to verify.  --full writes every byte the old way.
+#
+import argparse
+import sys
 
 import pl3
 
 from serialport import SerialPort
 
-eeprom_data = pl3.get_eeprom_data()
-BAUD_RATE = 19200  # note that this is a function of the EEPROM programming
+BAUD_RATE = 19200  # first guess, autodetect_baud() finds the rate the EEPROM is programmed for
+
+
+def load_profile(filename):
+    """
+    read a target eeprom image, either EepromImage.to_json() output or the raw EEPROM_LENGTH bytes.
+    """
+    if filename.endswith('.json'):
+        with open(filename, 'r') as profile_file:
+            return pl3.EepromImage.from_json(profile_file.read()).data
+    with open(filename, 'rb') as profile_file:
+        data = bytearray(profile_file.read())
+    if len(data) != pl3.EEPROM_LENGTH:
+        raise ValueError('{} is {} bytes, expected {}'.format(filename, len(data), pl3.EEPROM_LENGTH))
+    return data
+
+
+def write_bytes(port, target, addresses):
+    """
+    write target[address] for each address.  returns the addresses that were not acknowledged.
+    """
+    failed = []
+    for address in addresses:
+        expect = pl3.write_ee(port, address, target[address])
+        cmd, result = pl3.receive_response(port, expect=expect, verbosity=0)
+        if cmd != pl3.CMD_WRITE_EEPROM or result != address:
+            failed.append(address)
+    return failed
+
+
+def verify_bytes(port, target, addresses):
+    """
+    read back each address.  returns the addresses that do not match target.
+    """
+    failed = []
+    for address in addresses:
+        expect = pl3.read_ee(port, address)
+        cmd, result = pl3.receive_response(port, expect=expect, verbosity=0)
+        if cmd != pl3.CMD_READ_EEPROM or result.address != address or result.data != target[address]:
+            failed.append(address)
+    return failed
 
 
 def main():
+    parser = argparse.ArgumentParser(description='program Prolaser III EEPROM')
+    parser.add_argument('--profile', help='eeprom image (.json or raw) to write, default is pl3.get_eeprom_data()')
+    parser.add_argument('--full', action='store_true', help='write every byte instead of only the changes')
+    parser.add_argument('--dry-run', action='store_true', help='show the changes but do not write them')
+    parser.add_argument('--upgrade-baud', action='store_true',
+                        help='only switch the gun to {} baud'.format(pl3.BAUD_RATES[0]))
+    args = parser.parse_args()
+
+    if args.profile:
+        target = load_profile(args.profile)
+    else:
+        target = bytearray(pl3.get_eeprom_data())
+    target[pl3.EEPROM_CHECKSUM_ADDRESS] = pl3.eeprom_checksum(target)
+
     port = SerialPort(baudrate=BAUD_RATE)
+    baudrate = pl3.autodetect_baud(port)
+    if baudrate is None:
+        print('no response from the gun at any baud rate')
+        return 1
+    if args.upgrade_baud:
+        baudrate = pl3.upgrade_baud(port)
+        print('gun is at {} baud'.format(baudrate))
+        return 0 if baudrate == pl3.BAUD_RATES[0] else 1
 
-    # program EEPROM
-    # first stage: make sure Prolaser III
-    expect = pl3.read_ee(port, 0x01)
-    device_id = pl3.receive_response(port, expect=expect)
-    if device_id != 0x12:
+    # make sure this is a Prolaser III and find out what is in it now.
+    image = pl3.read_eeprom_image(port, refresh=True)
+    if image is None:
+        if not args.full:
+            print('could not read current eeprom, use --full to write it anyway')
+            return 1
+        expect = pl3.read_ee(port, pl3.EEPROM_MAGIC_ADDRESS)
+        cmd, result = pl3.receive_response(port, expect=expect)
+        device_id = result.data if cmd == pl3.CMD_READ_EEPROM else None
+    else:
+        device_id = image.device_id
+    if device_id != pl3.EEPROM_MAGIC:
         print('bad device_id {}'.format(device_id))
-        return
-    time.sleep(1.0)
-
-    #fw_address = 0xaf  # address to fuck with
-    #print('eeprom_data[{:02x}] = {:02x}'.format(fw_address, eeprom_data[fw_address]))
-    #eeprom_data[fw_address] |= 0x80
-    #print('eeprom_data[{:02x}] = {:02x}'.format(fw_address, eeprom_data[fw_address]))
+        return 1
 
-    # recalculate checksum:
-    eeprom_checksum = 0
-    for address in range(0, pl3.EEPROM_LENGTH - 1):
-        eeprom_checksum = (eeprom_checksum + eeprom_data[address]) & 0x00ff
-    eeprom_data[0xb7] = eeprom_checksum  # CHECKSUM!
+    if args.full:
+        addresses = list(range(pl3.EEPROM_LENGTH))
+    else:
+        addresses = [address for address in range(pl3.EEPROM_LENGTH) if image[address] != target[address]]
+    if len(addresses) == 0:
+        print('eeprom already matches, nothing to write')
+        return 0
+    if args.full:
+        print('writing all {} bytes'.format(len(addresses)))
+    else:
+        for address in addresses:
+            print('{:02x}: {:02x} -> {:02x}'.format(address, image[address], target[address]))
+    if args.dry_run:
+        return 0
 
     expect = pl3.enable_remote(port)
     pl3.receive_response(port, expect=expect)
-    for i in range(0, pl3.EEPROM_LENGTH):
-        expect = pl3.write_ee(port, i, eeprom_data[i])
-        result = pl3.receive_response(port, expect=expect)
+    failed = write_bytes(port, target, addresses)
+    if len(failed) > 0:
+        print('retrying {} writes'.format(len(failed)))
+        failed = write_bytes(port, target, failed)
+    mismatched = verify_bytes(port, target, addresses)
     expect = pl3.exit_remote(port)
     pl3.receive_response(port, expect=expect)
 
+    if len(failed) > 0 or len(mismatched) > 0:
+        for address in mismatched:
+            print('verify failed at {:02x}'.format(address))
+        print('{} bytes not written, {} bytes did not verify'.format(len(failed), len(mismatched)))
+        return 1
+
     expect = pl3.reset(port)
-    result = pl3.receive_response(port, expect=expect, timeouts=1000)
+    pl3.receive_response(port, expect=expect, timeout_ms=pl3.RESET_TIMEOUT_MS)
 
-    print('done')
+    print('done, {} bytes written'.format(len(addresses)))
+    return 0
 
 
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
@@ -10,12 +10,14 @@ import pl3
 
 from serialport import SerialPort
 
-_eeprom_data = pl3._eeprom_data
-BAUD_RATE = 19200  # note that this is a function of the EEPROM programming
+BAUD_RATE = 19200  # first guess, autodetect_baud() finds the rate the EEPROM is programmed for
 
 
 def main():
     port = SerialPort(baudrate=BAUD_RATE)
+    if pl3.autodetect_baud(port) is None:
+        print('no response from the gun at any baud rate')
+        return
 
     expect = pl3.enable_remote(port)
     pl3.receive_response(port, expect=expect)
@@ -61,19 +63,19 @@ def main():
     pl3.receive_response(port, expect=expect)
 
     expect = pl3.toggle_laser(port)  # if laser is off, nothing is expected...
-    command, result = pl3.receive_response(port, expect=expect, timeouts=20)
+    command, result = pl3.receive_response(port, expect=expect, timeout_ms=400)
     print(command, result)
 
     print('listening...')
     s = time.time() + 10
     while time.time() < s:
-        msg = pl3.receive_response(port, expect=11, timeouts=20)  # receive timeout at 20 ms, so <= 400 msec
+        msg = pl3.receive_response(port, expect=11, timeout_ms=400)
         print(msg)
 
     # send fire laser toggle command 07
     expect = pl3.toggle_laser(port)  # if laser is off, nothing is expected...
 
-    result = pl3.receive_response(port, expect=expect, timeouts=100)
+    result = pl3.receive_response(port, expect=expect, timeout_ms=2000)
     print(result)
 
     #send_1_byte_command(port, CMD_TOGGLE_LASER, timeouts=25)  # <= 500 msec
@@ -30,65 +30,42 @@ def main():
                                 stopbits=serial.STOPBITS_ONE,
                                 timeout=0)
 
-        tx_buffer = bytearray()
-        rx_buffer = bytearray()
-        tx_escaped = False
-        rx_escaped = False
+        tx_decoder = pl3.FrameDecoder(name='tx')
+        rx_decoder = pl3.FrameDecoder(name='rx')
+        buf = bytearray(32)
 
-        eeprom_data = pl3.get_eeprom_data()
+        eeprom_data = bytearray(pl3.get_eeprom_data())
         while True:
             while True:
-                buf = tx_port.read(32)
-                if buf is not None and len(buf) > 0:
-                    # dump_buffer('tx', buf, True)
-                    for b in buf:
-                        tx_was_escaped = tx_escaped
-                        if tx_escaped:
-                            tx_escaped = False
-                        else:
-                            if b == pl3.MESSAGE_ESCAPE:
-                                tx_escaped = True
-                        if b == pl3.START_OF_MESSAGE and len(tx_buffer) > 0 and tx_buffer[0] != pl3.START_OF_MESSAGE:
-                            tx_buffer = bytearray()
-                        tx_buffer.append(b)
-                        if b == pl3.END_OF_MESSAGE and not tx_was_escaped:
-                            cmd, result = pl3.process_tx_buffer(tx_buffer, verbosity=verbosity)
-                            if cmd == pl3.CMD_WRITE_EEPROM:
-                                addr = result[0]
-                                data = result[1]
-                                if eeprom_data[addr] != data:
-                                    print('    eeprom_data[{.02x}] was {:02x}, wrote {:02x}', format(addr,
-                                                                                                     eeprom_data[addr],
-                                                                                                     data))
-                                    eeprom_data[addr] = data
-                            tx_buffer = bytearray()
+                n = tx_port.readinto(buf)
+                if n is not None and n > 0:
+                    # dump_buffer('tx', buf[:n], True)
+                    for frame in tx_decoder.feed(buf, n):
+                        cmd, result = pl3.process_tx_frame(frame, verbosity=verbosity)
+                        if cmd == pl3.CMD_WRITE_EEPROM:
+                            addr = result[0]
+                            data = result[1]
+                            if eeprom_data[addr] != data:
+                                print('    eeprom_data[{:02x}] was {:02x}, wrote {:02x}'.format(addr,
+                                                                                               eeprom_data[addr],
+                                                                                               data))
+                                eeprom_data[addr] = data
                 else:
                     break
             while True:
-                buf = rx_port.read(32)
-                if buf is not None and len(buf) > 0:
-                    # dump_buffer('rx', buf, True)
-                    for b in buf:
-                        rx_was_escaped = rx_escaped
-                        if rx_escaped:
-                            rx_escaped = False
-                        else:
-                            if b == pl3.MESSAGE_ESCAPE:
-                                rx_escaped = True
-                        if b == pl3.START_OF_MESSAGE and len(rx_buffer) > 0 and rx_buffer[0] != pl3.START_OF_MESSAGE:
-                            rx_buffer = bytearray()
-                        rx_buffer.append(b)
-                        if b == pl3.END_OF_MESSAGE and not rx_was_escaped:
-                            cmd, result = pl3.process_rx_buffer(rx_buffer, verbosity=verbosity)
-                            if cmd == pl3.CMD_READ_EEPROM:
-                                addr = result[0]
-                                data = result[1]
-                                if eeprom_data[addr] != data:
-                                    print('    eeprom_data[{.02x}] was {:02x}, read {:02x}', format(addr,
-                                                                                                    eeprom_data[addr],
-                                                                                                    data))
-                                    eeprom_data[addr] = data
-                            rx_buffer = bytearray()
+                n = rx_port.readinto(buf)
+                if n is not None and n > 0:
+                    # dump_buffer('rx', buf[:n], True)
+                    for frame in rx_decoder.feed(buf, n):
+                        cmd, result = pl3.process_rx_frame(frame, verbosity=verbosity)
+                        if cmd == pl3.CMD_READ_EEPROM:
+                            addr = result[0]
+                            data = result[1]
+                            if eeprom_data[addr] != data:
+                                print('    eeprom_data[{:02x}] was {:02x}, read {:02x}'.format(addr,
+                                                                                              eeprom_data[addr],
+                                                                                              data))
+                                eeprom_data[addr] = data
                 else:
                     break
 
@@ -4,14 +4,21 @@
 #
 import sys
 
+POLL_INTERVAL = 0.040  # seconds between reads when data arrival cannot be awaited
+DEFAULT_RXBUF = 256  # bytes of UART receive buffer on micropython
+
 
 class SerialPort:
-    def __init__(self, name='', baudrate=19200, timeout=0.040):
+    def __init__(self, name='', baudrate=19200, timeout=0.040, rxbuf=DEFAULT_RXBUF):
         impl_name = sys.implementation.name
+        self.baudrate = baudrate
+        self._fileno = None
+        self._stream = None
         if impl_name == 'cpython':
             import serial
             if name == '':
-                name = 'com1:'
+                import os
+                name = os.environ.get('PL3_SERIAL_PORT', 'com1:')  # point at a pl3sim.py pty to run without a gun
             self.port = serial.Serial(port=name,
                                       baudrate=baudrate,
                                       parity=serial.PARITY_NONE,
@@ -19,6 +26,10 @@ class SerialPort:
                                       stopbits=serial.STOPBITS_ONE,
                                       timeout=timeout)  # seems fully reliable at 20 ms at 19200
             # reliable at 0.040 for 4800
+            try:
+                self._fileno = self.port.fileno()
+            except (AttributeError, OSError):
+                pass  # no file descriptor on windows, read_into_async polls instead.
         elif impl_name == 'micropython':
             import machine
             if name == '':
@@ -30,6 +41,7 @@ class SerialPort:
                                      stop=1,
                                      timeout=timeout_msec,
                                      timeout_char=timeout_msec,
+                                     rxbuf=rxbuf,
                                      tx=machine.Pin(0),
                                      rx=machine.Pin(1))
         else:
@@ -38,6 +50,13 @@ class SerialPort:
     def close(self):
         self.port.close()
 
+    def set_baudrate(self, baudrate):
+        if sys.implementation.name == 'micropython':
+            self.port.init(baudrate=baudrate)
+        else:
+            self.port.baudrate = baudrate  # pyserial reconfigures the open port
+        self.baudrate = baudrate
+
     def write(self, buffer):
         self.port.write(buffer)
 
@@ -49,3 +68,41 @@ class SerialPort:
         result = self.port.readinto(buf)
         return 0 if result is None else result
 
+    async def read_into_async(self, buf):
+        """
+        wait until data arrives, then read what is available into buf.  returns the number of bytes read.
+        on cpython the port file descriptor is watched by the event loop, on micropython the UART is wrapped in
+        a uasyncio StreamReader, otherwise the port is polled.
+        """
+        if sys.implementation.name == 'micropython':
+            import uasyncio as asyncio
+            if self._stream is None:
+                self._stream = asyncio.StreamReader(self.port)
+            if hasattr(self._stream, 'readinto'):
+                result = await self._stream.readinto(buf)
+                return 0 if result is None else result
+            data = await self._stream.read(len(buf))  # older uasyncio has no StreamReader.readinto
+            buf[:len(data)] = data
+            return len(data)
+        import asyncio
+        if self._fileno is not None:
+            loop = asyncio.get_running_loop()
+            ready = asyncio.Event()
+            try:
+                loop.add_reader(self._fileno, ready.set)
+            except NotImplementedError:
+                self._fileno = None  # event loop cannot watch file descriptors (windows proactor)
+            else:
+                try:
+                    await ready.wait()
+                finally:
+                    loop.remove_reader(self._fileno)
+                waiting = min(len(buf), self.port.in_waiting)
+                if waiting == 0:
+                    return 0
+                return self.readinto(memoryview(buf)[:waiting])
+        while True:
+            result = self.readinto(buf)
+            if result > 0:
+                return result
+            await asyncio.sleep(POLL_INTERVAL)
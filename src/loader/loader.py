@@ -13,10 +13,15 @@ SRC_DIR = '../prolaser3/'
 FILES_LIST = [
     'content/',
     'data/',
+    'contentcache.py',
+    'eventhub.py',
     'main.py',
     'ntp.py',
     'pl3.py',
+    'pl3session.py',
+    'readinglog.py',
     'serialport.py',
+    'websocket.py',
     'content/files.html',
     'content/prolaser.html',
     'content/setup.html',
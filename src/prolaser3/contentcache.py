@@ -0,0 +1,77 @@
+#
+# in memory cache of static web content for the web server.
+# whole files are kept up to a total byte budget, the least recently used files are dropped first.
+#
+import binascii
+import hashlib
+
+DEFAULT_MAX_BYTES = 32768
+
+
+def make_etag(data):
+    """
+    a strong etag for data, quoted, ready for the ETag header.
+    """
+    return '"{}"'.format(binascii.hexlify(hashlib.sha1(data).digest()[:8]).decode())
+
+
+def etag_matches(if_none_match, etag):
+    """
+    True if the If-None-Match header value matches etag.
+    """
+    if if_none_match == '*':
+        return True
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+class ContentCache:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0  # bytes of content held
+        self._entries = {}  # filename: (data, etag)
+        self._order = []  # cached filenames, least recently used first
+
+    def get(self, filename):
+        """
+        returns the (data, etag) for filename, or None if it is not cached.
+        """
+        entry = self._entries.get(filename)
+        if entry is not None and self._order[-1] != filename:
+            self._order.remove(filename)
+            self._order.append(filename)
+        return entry
+
+    def put(self, filename, data):
+        """
+        cache the content of filename, dropping older files to stay within max_bytes.
+        returns the (data, etag) entry.  data bigger than max_bytes is not kept.
+        """
+        self.invalidate(filename)
+        entry = (data, make_etag(data))
+        if len(data) <= self.max_bytes:
+            while self.size + len(data) > self.max_bytes:
+                self.invalidate(self._order[0])
+            self._entries[filename] = entry
+            self._order.append(filename)
+            self.size += len(data)
+        return entry
+
+    def invalidate(self, filename):
+        """
+        forget filename, call this whenever the file is written, renamed or removed.
+        """
+        entry = self._entries.pop(filename, None)
+        if entry is not None:
+            self._order.remove(filename)
+            self.size -= len(entry[0])
+
+    def clear(self):
+        self._entries = {}
+        self._order = []
+        self.size = 0
@@ -0,0 +1,74 @@
+#
+# fan out of serialized events to streaming web clients.
+# runs on both cpython asyncio and micropython uasyncio.
+#
+import sys
+
+if sys.implementation.name == 'micropython':
+    import uasyncio as asyncio
+else:
+    import asyncio
+
+
+class Subscriber:
+    """
+    one client's queue of events.  when the client falls behind, the oldest events are dropped.
+    """
+
+    def __init__(self, max_queue):
+        self.max_queue = max_queue
+        self.dropped = 0
+        self._queue = []
+        self._ready = asyncio.Event()
+
+    def put(self, data):
+        if len(self._queue) >= self.max_queue:
+            self._queue.pop(0)
+            self.dropped += 1
+        self._queue.append(data)
+        self._ready.set()
+
+    async def get(self, timeout=None):
+        """
+        wait for events, returns the list of events queued since the last call, empty if timeout expired first.
+        """
+        if len(self._queue) == 0:
+            try:
+                if timeout is None:
+                    await self._ready.wait()
+                else:
+                    await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self._ready.clear()
+        events = self._queue
+        self._queue = []
+        return events
+
+
+class EventHub:
+    def __init__(self, max_subscribers=4, max_queue=16):
+        self.max_subscribers = max_subscribers
+        self.max_queue = max_queue
+        self.subscribers = []
+
+    def subscribe(self):
+        """
+        returns a new Subscriber, or None if there are already max_subscribers.
+        """
+        if len(self.subscribers) >= self.max_subscribers:
+            return None
+        subscriber = Subscriber(self.max_queue)
+        self.subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        if subscriber in self.subscribers:
+            self.subscribers.remove(subscriber)
+
+    def publish(self, data):
+        """
+        queue data, already serialized, for every subscriber.
+        """
+        for subscriber in self.subscribers:
+            subscriber.put(data)
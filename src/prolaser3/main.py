@@ -31,12 +31,18 @@ import gc
 import json
 import os
 import re
+import struct
 import sys
 import time
 
 import ntp
 import pl3
+from contentcache import ContentCache, etag_matches
+from eventhub import EventHub
+from pl3session import Pl3Session
+from readinglog import ReadingLog, format_record
 from serialport import SerialPort
+import websocket
 
 upython = sys.implementation.name == 'micropython'
 
@@ -94,6 +100,7 @@ CT_TEXT_HTML = 'text/html'
 CT_APP_JSON = 'application/json'
 CT_APP_WWW_FORM = 'application/x-www-form-urlencoded'
 CT_MULTIPART_FORM = 'multipart/form-data'
+CT_TEXT_EVENT_STREAM = 'text/event-stream'
 DANGER_ZONE_FILE_NAMES = [
     'config.html',
     'files.html',
@@ -101,7 +108,9 @@ DANGER_ZONE_FILE_NAMES = [
 ]
 DEFAULT_SECRET = 'prolaser3'
 DEFAULT_SSID = 'lidar'
+DEFAULT_CONTENT_CACHE_BYTES = 32768
 DEFAULT_TCP_PORT = 73
+DEFAULT_UART_RXBUF = 256
 DEFAULT_WEB_PORT = 80
 FILE_EXTENSION_TO_CONTENT_TYPE_MAP = {
     'gif': 'image/gif',
@@ -116,6 +125,7 @@ FILE_EXTENSION_TO_CONTENT_TYPE_MAP = {
 }
 HYPHENS = '--'
 HTTP_STATUS_TEXT = {
+    101: 'Switching Protocols',
     200: 'OK',
     201: 'Created',
     202: 'Accepted',
@@ -162,6 +172,11 @@ MORSE_PATTERNS = {  # sparse to save space
     #  'D': (MORSE_DAH, MORSE_DIT, MORSE_DIT),
     #  'B': (MORSE_DAH, MORSE_DIT, MORSE_DIT, MORSE_DIT),
 }
+GC_MIN_FREE = 32768  # collect garbage after a request only when less heap than this is free
+HTTP_IDLE_TIMEOUT_SECS = 5  # close kept alive connections that send nothing for this long
+MAX_HTTP_CONNECTIONS = 6  # connections over this get one response and are closed, lwip has few sockets
+EVENT_KEEPALIVE_SECS = 15  # comment line sent to idle event stream clients, finds dead connections
+WS_READING_FORMAT = '<BIBHB'  # CMD_READING, seq, speed, range (feet * 10), status
 MP_START_BOUND = 1
 MP_HEADERS = 2
 MP_DATA = 3
@@ -173,10 +188,15 @@ laser_state = False
 last_speed = 0
 last_range = 0
 MAX_MESSAGES = 100
-messages = []
+reading_log = ReadingLog(MAX_MESSAGES)
+event_hub = EventHub()
+content_cache = ContentCache(DEFAULT_CONTENT_CACHE_BYTES)
+websocket_hub = EventHub()
 morse_message = ''
 restart = False
 port = None
+session = None
+http_connections = 0
 
 
 def get_timestamp(tt=None):
@@ -213,6 +233,215 @@ def safe_int(s, default=-1):
         return int(s) if s.isdigit() else default
 
 
+def get_cursor(args):
+    """
+    the since= cursor from the request args, -1 (everything) if it is missing, bad, or from before a restart.
+    """
+    since = args.get('since')
+    if since is None:
+        return -1
+    since = safe_int(since, -1)
+    if since >= reading_log.next_seq:
+        return -1
+    return since
+
+
+def get_status_payload(since):
+    return {'timestamp': get_timestamp(),
+            'laser_mode': laser_mode,
+            'laser_state': laser_state,
+            'last_speed': last_speed,
+            'last_range': last_range,
+            'cursor': reading_log.next_seq - 1,
+            'messages': [format_record(reading_log.get(seq), get_timestamp) for seq in reading_log.since(since)],
+            }
+
+
+def publish_status(since, websocket_clients=True):
+    """
+    push the status with the messages after since to the event stream clients, and to the websocket clients
+    unless websocket_clients is False.
+    """
+    if len(event_hub.subscribers) > 0:
+        event_hub.publish('event: status\ndata: {}\n\n'.format(json.dumps(get_status_payload(since))).encode())
+    if websocket_clients and len(websocket_hub.subscribers) > 0:
+        websocket_hub.publish(websocket.build_frame(websocket.OP_TEXT, json.dumps(get_status_payload(since)).encode()))
+
+
+def publish_reading(seq, reading):
+    """
+    push one reading to the websocket clients as a small binary frame.
+    """
+    if len(websocket_hub.subscribers) > 0:
+        payload = struct.pack(WS_READING_FORMAT, pl3.CMD_READING, seq, reading.speed, reading.range, reading.status)
+        websocket_hub.publish(websocket.build_frame(websocket.OP_BINARY, payload))
+
+
+def set_laser_mode(mode):
+    """
+    change the gun mode.  returns False if mode is not valid.
+    """
+    global laser_mode
+    if mode not in [pl3.MODE_SPEED, pl3.MODE_RANGE, pl3.MODE_RTR]:
+        return False
+    laser_mode = mode
+    pl3.set_mode(port, mode)
+    publish_status(reading_log.next_seq - 1)
+    return True
+
+
+async def serve_events(writer):
+    """
+    stream status events to a client until it goes away.
+    """
+    if writer.head:
+        return send_simple_response(writer, 200, CT_TEXT_EVENT_STREAM, None, ['Cache-Control: no-cache']), 200
+    subscriber = event_hub.subscribe()
+    if subscriber is None:
+        return send_simple_response(writer, 503, CT_TEXT_TEXT, b'too many event clients\r\n'), 503
+    bytes_sent = 0
+    writer.keep_alive = False
+    try:
+        start_response(writer, 200, CT_TEXT_EVENT_STREAM, 0, ['Cache-Control: no-cache'])
+        data = 'event: status\ndata: {}\n\n'.format(json.dumps(get_status_payload(-1))).encode()
+        while True:
+            writer.write(data)
+            bytes_sent += len(data)
+            await writer.drain()
+            events = await subscriber.get(EVENT_KEEPALIVE_SECS)
+            data = b''.join(events) if len(events) > 0 else b': keepalive\n\n'
+    except OSError:
+        pass  # client went away
+    finally:
+        event_hub.unsubscribe(subscriber)
+    return bytes_sent, 200
+
+
+def command_int(value):
+    """
+    a websocket command value as an int, or None unless it is an int or a string of digits.
+    """
+    if type(value) == int:
+        return value
+    if type(value) == str and value.isdigit():
+        return int(value)
+    return None
+
+
+def websocket_command(payload):
+    """
+    run one command message from a websocket client.  returns the reply payload, or None.
+    """
+    try:
+        command = json.loads(bytes(payload).decode())
+        cmd = command.get('cmd')
+    except (ValueError, AttributeError):
+        return b'{"error": "bad command"}'
+    if cmd == 'laser':
+        pl3.toggle_laser(port)
+        return None
+    if cmd == 'mode':
+        mode = command_int(command.get('set'))
+        if mode is None or not set_laser_mode(mode):
+            return b'{"error": "parameter out of range"}'
+        return None
+    if cmd == 'status':
+        since = command_int(command.get('since', -1))
+        if since is None:
+            return b'{"error": "parameter out of range"}'
+        if since >= reading_log.next_seq:
+            since = -1
+        return json.dumps(get_status_payload(since)).encode()
+    return b'{"error": "unknown command"}'
+
+
+async def websocket_receiver(reader, writer, subscriber):
+    """
+    handle the messages from a websocket client.  puts None to subscriber when the client closes.
+    """
+    messages = websocket.MessageReader(reader)
+    try:
+        while True:
+            opcode, payload = await messages.read()
+            if opcode == websocket.OP_CLOSE:
+                writer.write(websocket.build_frame(websocket.OP_CLOSE, payload[:2]))
+                break
+            elif opcode == websocket.OP_PING:
+                writer.write(websocket.build_frame(websocket.OP_PONG, payload))
+            elif opcode == websocket.OP_TEXT:
+                reply = websocket_command(payload)
+                if reply is not None:
+                    writer.write(websocket.build_frame(websocket.OP_TEXT, reply))
+    except websocket.ProtocolError:
+        writer.write(websocket.build_frame(websocket.OP_CLOSE, struct.pack('!H', websocket.CLOSE_PROTOCOL_ERROR)))
+    except (OSError, ValueError):
+        pass  # client went away or broke the protocol
+    finally:
+        subscriber.put(None)
+
+
+async def serve_websocket(reader, writer, key):
+    """
+    upgrade the connection to a websocket.  the client gets the status as json text frames and each reading as
+    a WS_READING_FORMAT binary frame, and can send json commands:
+    {"cmd": "mode", "set": 1}, {"cmd": "laser"} and {"cmd": "status", "since": cursor}.
+    """
+    subscriber = websocket_hub.subscribe()
+    if subscriber is None:
+        return send_simple_response(writer, 503, CT_TEXT_TEXT, b'too many websocket clients\r\n'), 503
+    bytes_sent = 0
+    receiver = None
+    writer.keep_alive = False
+    try:
+        writer.write(websocket.handshake_response(key))
+        receiver = asyncio.create_task(websocket_receiver(reader, writer, subscriber))
+        frames = [websocket.build_frame(websocket.OP_TEXT, json.dumps(get_status_payload(-1)).encode())]
+        while True:
+            for frame in frames:
+                writer.write(frame)
+                bytes_sent += len(frame)
+            await writer.drain()
+            frames = await subscriber.get(EVENT_KEEPALIVE_SECS)
+            if None in frames:
+                break
+            if len(frames) == 0:
+                frames = [websocket.build_frame(websocket.OP_PING)]
+    except OSError:
+        pass  # client went away
+    finally:
+        websocket_hub.unsubscribe(subscriber)
+        if receiver is not None:
+            receiver.cancel()
+    return bytes_sent, 101
+
+
+class HttpWriter:
+    """
+    stream writer for one web client connection.  keep_alive says if the connection stays open after the
+    response, start_response() sends the matching Connection header.  head is set for HEAD requests, the
+    response body is not sent.
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.keep_alive = False
+        self.head = False
+
+    def write(self, data):
+        self.writer.write(data)
+
+    async def drain(self):
+        await self.writer.drain()
+
+
+def collect_garbage():
+    """
+    collect when the heap is getting full, instead of after every request.
+    """
+    if upython and gc.mem_free() < GC_MIN_FREE:
+        gc.collect()
+
+
 def milliseconds():
     if upython:
         return time.ticks_ms()
@@ -234,23 +463,49 @@ def valid_filename(filename):
     return True
 
 
-def serve_content(writer, filename):
-    filename = CONTENT_DIR + filename
-    try:
-        content_length = safe_int(os.stat(filename)[6], -1)
-    except OSError:
-        content_length = -1
+def serve_content(writer, filename, if_none_match=None):
+    """
+    send a file from CONTENT_DIR.  files that fit in content_cache are sent from memory with an ETag,
+    and a matching if_none_match gets 304 Not Modified.  bigger files are streamed from flash.
+    """
+    entry = content_cache.get(filename)
+    content_length = len(entry[0]) if entry is not None else -1
+    if entry is None:
+        try:
+            content_length = safe_int(os.stat(CONTENT_DIR + filename)[6], -1)
+        except OSError:
+            content_length = -1
+        if 0 <= content_length <= content_cache.max_bytes:
+            try:
+                with open(CONTENT_DIR + filename, 'rb') as infile:
+                    entry = content_cache.put(filename, infile.read())
+                content_length = len(entry[0])
+            except OSError:
+                content_length = -1
     if content_length < 0:
         response = b'<html><body><p>404.  Means &quot;no got&quot;.</p></body></html>'
         http_status = 404
         return send_simple_response(writer, http_status, CT_TEXT_HTML, response), http_status
+    extension = filename.split('.')[-1]
+    content_type = FILE_EXTENSION_TO_CONTENT_TYPE_MAP.get(extension)
+    if content_type is None:
+        content_type = FILE_EXTENSION_TO_CONTENT_TYPE_MAP.get('*')
+    if entry is not None:
+        data, etag = entry
+        headers = ['ETag: {}'.format(etag), 'Cache-Control: no-cache']
+        if if_none_match is not None and etag_matches(if_none_match, etag):
+            start_response(writer, 304, None, 0, headers)
+            return 0, 304
+        http_status = 200
+        start_response(writer, http_status, content_type, content_length, headers)
+        if not writer.head:
+            writer.write(data)
     else:
-        extension = filename.split('.')[-1]
-        content_type = FILE_EXTENSION_TO_CONTENT_TYPE_MAP.get(extension)
-        if content_type is None:
-            content_type = FILE_EXTENSION_TO_CONTENT_TYPE_MAP.get('*')
+        filename = CONTENT_DIR + filename
         http_status = 200
-        start_response(writer, 200, content_type, content_length)
+        start_response(writer, 200, content_type, content_length, ['Cache-Control: no-cache'])
+        if writer.head:
+            return content_length, http_status
         try:
             with open(filename, 'rb', BUFFER_SIZE) as infile:
                 while True:
@@ -260,17 +515,21 @@ def serve_content(writer, filename):
                         break
         except Exception as e:
             print(type(e), e)
-        return content_length, http_status
+    return content_length, http_status
 
 
 def start_response(writer, http_status=200, content_type=None, response_size=0, extra_headers=None):
     status_text = HTTP_STATUS_TEXT.get(http_status) or 'Confused'
-    protocol = 'HTTP/1.0'
+    protocol = 'HTTP/1.1'
     writer.write('{} {} {}\r\n'.format(protocol, http_status, status_text).encode('utf-8'))
     if content_type is not None and len(content_type) > 0:
         writer.write('Content-type: {}; charset=UTF-8\r\n'.format(content_type).encode('utf-8'))
-    if response_size > 0:
+    if response_size > 0 or (writer.keep_alive and http_status != 304):
         writer.write('Content-length: {}\r\n'.format(response_size).encode('utf-8'))
+    if writer.keep_alive:
+        writer.write(b'Connection: keep-alive\r\n')
+    else:
+        writer.write(b'Connection: close\r\n')
     if extra_headers is not None:
         for header in extra_headers:
             writer.write('{}\r\n'.format(header).encode('utf-8'))
@@ -280,7 +539,7 @@ def start_response(writer, http_status=200, content_type=None, response_size=0,
 def send_simple_response(writer, http_status=200, content_type=None, response=None, extra_headers=None):
     content_length = len(response) if response else 0
     start_response(writer, http_status, content_type, content_length, extra_headers)
-    if response is not None and len(response) > 0:
+    if response is not None and len(response) > 0 and not writer.head:
         writer.write(response)
     return content_length
 
@@ -391,21 +650,57 @@ async def serve_serial_client(reader, writer):
 
 
 async def serve_http_client(reader, writer):
-    global laser_mode, laser_state
-    global restart
+    """
+    serve requests from one web client until it closes the connection, goes idle, or a response ends it.
+    """
+    global http_connections
     verbosity = 3
-    t0 = milliseconds()
-    http_status = 418  # can only make tea, sorry.
-    bytes_sent = 0
     partner = writer.get_extra_info('peername')[0]
     if verbosity >= 4:
         print('\nweb client connected from {}'.format(partner))
-    request_line = await reader.readline()
+    http_writer = HttpWriter(writer)
+    http_connections += 1
+    try:
+        while True:
+            try:
+                request_line = await asyncio.wait_for(reader.readline(), HTTP_IDLE_TIMEOUT_SECS)
+            except asyncio.TimeoutError:
+                break
+            if len(request_line) == 0:
+                break  # client closed the connection
+            http_writer.keep_alive = http_connections <= MAX_HTTP_CONNECTIONS
+            http_writer.head = False
+            await serve_http_request(reader, http_writer, partner, request_line, verbosity)
+            await writer.drain()
+            collect_garbage()
+            if not http_writer.keep_alive:
+                break
+    except OSError:
+        pass  # client already went away, like event stream clients do.
+    finally:
+        http_connections -= 1
+        try:
+            writer.close()
+            await writer.wait_closed()
+        except OSError:
+            pass
+
+
+async def serve_http_request(reader, writer, partner, request_line, verbosity):
+    """
+    read the rest of one request and send the response.  writer is the connection's HttpWriter,
+    writer.keep_alive is cleared if the connection must be closed afterwards.
+    """
+    global restart
+    t0 = milliseconds()
+    http_status = 418  # can only make tea, sorry.
+    bytes_sent = 0
     request = request_line.decode().strip()
     if verbosity >= 4:
         print(request)
     pieces = request.split(' ')
     if len(pieces) != 3:  # does the http request line look approximately correct?
+        writer.keep_alive = False  # the headers were not read
         http_status = 400
         response = b'Bad Request !=3'
         bytes_sent = send_simple_response(writer, http_status, CT_TEXT_HTML, response)
@@ -420,11 +715,13 @@ async def serve_http_client(reader, writer):
             query_args = pieces[1]
         else:
             query_args = ''
-        if verb not in ['GET', 'POST']:
+        if verb not in ['GET', 'HEAD', 'POST']:
+            writer.keep_alive = False
             http_status = 400
-            response = b'<html><body><p>only GET and POST are supported</p></body></html>'
+            response = b'<html><body><p>only GET, HEAD and POST are supported</p></body></html>'
             bytes_sent = send_simple_response(writer, http_status, CT_TEXT_HTML, response)
         elif protocol not in ['HTTP/1.0', 'HTTP/1.1']:
+            writer.keep_alive = False
             http_status = 400
             response = b'that protocol is not supported'
             bytes_sent = send_simple_response(writer, http_status, CT_TEXT_HTML, response)
@@ -432,6 +729,12 @@ async def serve_http_client(reader, writer):
             # get HTTP request headers
             request_content_length = 0
             request_content_type = ''
+            websocket_key = None
+            if_none_match = None
+            if verb == 'HEAD':
+                writer.head = True
+                verb = 'GET'  # same response, without the body
+            connection = 'keep-alive' if protocol == 'HTTP/1.1' else 'close'
             while True:
                 header = await reader.readline()
                 if len(header) == 0:
@@ -444,10 +747,19 @@ async def serve_http_client(reader, writer):
                     # process headers.  look for those we are interested in.
                     # print(header)
                     parts = header.decode().strip().split(':', 1)
-                    if parts[0] == 'Content-Length':
+                    name = parts[0].lower()
+                    if name == 'content-length':
                         request_content_length = int(parts[1].strip())
-                    elif parts[0] == 'Content-Type':
+                    elif name == 'content-type':
                         request_content_type = parts[1].strip()
+                    elif name == 'connection':
+                        connection = parts[1].strip().lower()
+                    elif name == 'if-none-match':
+                        if_none_match = parts[1].strip()
+                    elif name == 'sec-websocket-key':
+                        websocket_key = parts[1].strip()
+            if connection != 'keep-alive':
+                writer.keep_alive = False
 
             args = {}
             if verb == 'GET':
@@ -455,11 +767,13 @@ async def serve_http_client(reader, writer):
             elif verb == 'POST':
                 if request_content_length > 0:
                     if request_content_type == CT_APP_WWW_FORM:
-                        data = await reader.read(request_content_length)
+                        data = await reader.readexactly(request_content_length)
                         args = unpack_args(data.decode())
                     elif request_content_type == CT_APP_JSON:
-                        data = await reader.read(request_content_length)
+                        data = await reader.readexactly(request_content_length)
                         args = json.loads(data.decode())
+                    elif target != '/api/upload_file':
+                        writer.keep_alive = False  # the body was not read
                     # else:
                     #    print('warning: unhandled content_type {}'.format(request_content_type))
                     #    print('request_content_length={}'.format(request_content_length))
@@ -515,11 +829,8 @@ async def serve_http_client(reader, writer):
             elif target == '/api/mode':
                 mode = args.get('set')
                 if mode is not None:
-                    mode = safe_int(mode, -1)
-                    if mode in [pl3.MODE_SPEED, pl3.MODE_RANGE, pl3.MODE_RTR]:
-                        laser_mode = mode
+                    if set_laser_mode(safe_int(mode, -1)):
                         response = '{{"mode": "{}"}}'.format(laser_mode).encode()
-                        pl3.set_mode(port, mode, verbosity=verbosity)
                         http_status = 200
                         bytes_sent = send_simple_response(writer, http_status, CT_APP_JSON, response)
                     else:
@@ -540,6 +851,7 @@ async def serve_http_client(reader, writer):
                         if boundary.startswith('boundary='):
                             boundary = boundary[9:]
                     if request_content_type != CT_MULTIPART_FORM or boundary is None:
+                        writer.keep_alive = False  # the body was not read
                         response = b'multipart boundary or content type error'
                         http_status = 400
                     else:
@@ -556,7 +868,9 @@ async def serve_http_client(reader, writer):
                         leftover_bytes = []
                         while more_bytes:
                             # print('waiting for read')
-                            buffer = await reader.read(BUFFER_SIZE)
+                            buffer = await reader.read(min(BUFFER_SIZE, remaining_content_length))
+                            if len(buffer) == 0:
+                                break  # client went away
                             # print('read {} bytes of max {}'.format(len(buffer), BUFFER_SIZE))
                             remaining_content_length -= len(buffer)
                             # print('remaining content length {}'.format(remaining_content_length))
@@ -569,6 +883,7 @@ async def serve_http_client(reader, writer):
                             while start < len(buffer):
                                 if state == MP_DATA:
                                     if not output_file:
+                                        content_cache.invalidate('uploaded_' + filename)
                                         output_file = open(CONTENT_DIR + 'uploaded_' + filename, 'wb')
                                         writing_file = True
                                     end = len(buffer)
@@ -636,10 +951,13 @@ async def serve_http_client(reader, writer):
                                     else:
                                         http_status = 500
                                         response = 'unmanaged state {}'.format(state).encode('utf-8')
+                        if remaining_content_length > 0:
+                            writer.keep_alive = False  # stopped before the end of the body
                     bytes_sent = send_simple_response(writer, http_status, CT_TEXT_TEXT, response)
             elif target == '/api/remove_file':
                 filename = args.get('filename')
                 if valid_filename(filename) and filename not in DANGER_ZONE_FILE_NAMES:
+                    content_cache.invalidate(filename)
                     filename = CONTENT_DIR + filename
                     try:
                         os.remove(filename)
@@ -656,6 +974,8 @@ async def serve_http_client(reader, writer):
                 filename = args.get('filename')
                 newname = args.get('newname')
                 if valid_filename(filename) and valid_filename(newname):
+                    content_cache.invalidate(filename)
+                    content_cache.invalidate(newname)
                     filename = CONTENT_DIR + filename
                     newname = CONTENT_DIR + newname
                     try:
@@ -678,24 +998,59 @@ async def serve_http_client(reader, writer):
                 response = b'ok\r\n'
                 http_status = 200
                 bytes_sent = send_simple_response(writer, http_status, CT_TEXT_TEXT, response)
+            elif target == '/api/eeprom':
+                image = await session.read_eeprom_image(refresh=args.get('refresh') is not None)
+                if image is None:
+                    http_status = 500
+                    response = b'eeprom read failed\r\n'
+                    bytes_sent = send_simple_response(writer, http_status, CT_TEXT_TEXT, response)
+                else:
+                    payload = {'device_id': image.device_id,
+                               'read_time': image.read_time,
+                               'age_ms': image.age_ms(),
+                               'checksum_ok': image.checksum_ok(),
+                               'fields': image.fields(),
+                               'data': pl3.buffer_to_hexes(image.data),
+                               }
+                    response = json.dumps(payload).encode('utf-8')
+                    http_status = 200
+                    bytes_sent = send_simple_response(writer, http_status, CT_APP_JSON, response)
             elif target == '/api/status':
-                payload = {'timestamp': get_timestamp(),
-                           'laser_mode': laser_mode,
-                           'laser_state': laser_state,
-                           'last_speed': last_speed,
-                           'last_range': last_range,
-                           'messages': messages,
-                           }
+                since = get_cursor(args)
+                cursor = reading_log.next_seq - 1
+                if safe_int(args.get('since', ''), -2) == cursor and args.get('full') is None:
+                    # no new messages, but the laser can be toggled or the mode set without one.
+                    response = json.dumps({'cursor': cursor,
+                                           'laser_state': laser_state,
+                                           'laser_mode': laser_mode}).encode('utf-8')
+                else:
+                    response = json.dumps(get_status_payload(since)).encode('utf-8')
+                http_status = 200
+                bytes_sent = send_simple_response(writer, http_status, CT_APP_JSON, response)
+            elif target == '/api/events':
+                bytes_sent, http_status = await serve_events(writer)
+            elif target == '/api/ws':
+                if websocket_key is None:
+                    http_status = 400
+                    response = b'websocket upgrade expected\r\n'
+                    bytes_sent = send_simple_response(writer, http_status, CT_TEXT_TEXT, response)
+                else:
+                    bytes_sent, http_status = await serve_websocket(reader, writer, websocket_key)
+            elif target == '/api/readings':
+                since = get_cursor(args)
+                readings = []
+                for seq in reading_log.since(since):
+                    timestamp, cmd, speed, rng, status = reading_log.get(seq)
+                    if cmd == pl3.CMD_READING:
+                        readings.append([seq, timestamp, speed, rng / 10.0, status])
+                payload = {'cursor': reading_log.next_seq - 1, 'readings': readings}
                 response = json.dumps(payload).encode('utf-8')
                 http_status = 200
                 bytes_sent = send_simple_response(writer, http_status, CT_APP_JSON, response)
             else:
                 content_file = target[1:] if target[0] == '/' else target
-                bytes_sent, http_status = serve_content(writer, content_file)
+                bytes_sent, http_status = serve_content(writer, content_file, if_none_match)
 
-    await writer.drain()
-    writer.close()
-    await writer.wait_closed()
     elapsed = milliseconds() - t0
     if http_status == 200:
         if verbosity > 2:
@@ -703,7 +1058,6 @@ async def serve_http_client(reader, writer):
     else:
         if verbosity >= 1:
             print('{} {} {} {} {} ms'.format(partner, request, http_status, bytes_sent, elapsed))
-    gc.collect()
 
 
 async def morse_sender():
@@ -725,55 +1079,41 @@ async def morse_sender():
                 await asyncio.sleep(MORSE_ESP / 100 if len(blink_list) > 0 else MORSE_LSP / 100)
 
 
-async def pl3_receiver(verbosity=4):
-    global laser_mode, laser_state, last_speed, last_range, messages
-    MAX_BUFFER = 256
-    pl3_buffer = bytearray(MAX_BUFFER)
-    buf_size = 0
-    rx_escaped = False
-    rx_buf = bytearray(32)
+async def pl3_receiver(verbosity=2):
+    global laser_mode, laser_state, last_speed, last_range
+    decoder = pl3.FrameDecoder()
+    rx_buf = bytearray(128)
     while True:
-        rx_bytes = port.readinto(rx_buf)
+        rx_bytes = await port.read_into_async(rx_buf)
         if rx_bytes > 0:
-            # pl3.dump_buffer('rx', buf, True)
-            for rxbi in range(rx_bytes):
-                b = rx_buf[rxbi]
-                rx_was_escaped = rx_escaped
-                if rx_escaped:
-                    rx_escaped = False
-                else:
-                    if b == pl3.MESSAGE_ESCAPE:
-                        rx_escaped = True
-                if b == pl3.START_OF_MESSAGE and len(pl3_buffer) > 0 and pl3_buffer[0] != pl3.START_OF_MESSAGE:
-                    buf_size = 0
-                if buf_size < MAX_BUFFER:
-                    pl3_buffer[buf_size] = b
-                    buf_size += 1
-                else:
-                    print('too much data')
-                if b == pl3.END_OF_MESSAGE and not rx_was_escaped:
-                    cmd, result = pl3.process_rx_buffer(pl3_buffer[:buf_size], verbosity=verbosity)
-                    if cmd == pl3.CMD_TOGGLE_LASER:
-                        laser_state = False
-                    elif cmd == pl3.CMD_READING:
-                        laser_state = True
-                        last_range = result[1]
-                        last_speed = result[2]
+            for frame in decoder.feed(rx_buf, rx_bytes):
+                cmd, result = pl3.process_rx_frame(frame, verbosity=verbosity)
+                if cmd == pl3.CMD_READING and result is None:
+                    continue  # too short to be a reading
+                if session is not None:
+                    session.dispatch(cmd, result)
+                if cmd == pl3.CMD_TOGGLE_LASER:
+                    laser_state = False
+                elif cmd == pl3.CMD_READING:
+                    laser_state = True
+                    if result.status == pl3.READING_OK:
+                        last_range = result.feet()
+                        last_speed = result.speed
                         if last_speed != 0:
                             laser_mode = pl3.MODE_SPEED
                         else:
                             laser_mode = pl3.MODE_RANGE
-                    message = '{} {:02x} - {}'.format(get_timestamp(), cmd, str(result))
-                    messages.append(message)
-                    if len(messages) > MAX_MESSAGES:
-                        messages = messages[-MAX_MESSAGES:]
-                    buf_size = 0
-        else:
-            await asyncio.sleep(0.040)
+                # only readings go in the log, so eeprom reads and other command responses cannot flood it.
+                if cmd == pl3.CMD_READING:
+                    reading_log.append_reading(int(time.time()), result)
+                    publish_reading(reading_log.next_seq - 1, result)
+                    publish_status(reading_log.next_seq - 2, False)
+                elif cmd == pl3.CMD_TOGGLE_LASER:
+                    publish_status(reading_log.next_seq - 1)  # laser_state changed
 
 
 async def main():
-    global port, restart
+    global port, restart, session
     config = read_config()
     tcp_port = safe_int(config.get('tcp_port') or DEFAULT_TCP_PORT, DEFAULT_TCP_PORT)
     if tcp_port < 0 or tcp_port > 65535:
@@ -800,8 +1140,24 @@ async def main():
 
     if upython:
         asyncio.create_task(morse_sender())
-
-    port = SerialPort(baudrate=19200, timeout=0)
+        gc.threshold(gc.mem_free() // 4 + gc.mem_alloc())  # let the allocator collect before the heap fills
+
+    uart_rxbuf = safe_int(config.get('uart_rxbuf') or DEFAULT_UART_RXBUF, DEFAULT_UART_RXBUF)
+    if uart_rxbuf < 32 or uart_rxbuf > 4096:
+        uart_rxbuf = DEFAULT_UART_RXBUF
+    port = SerialPort(baudrate=19200, timeout=0, rxbuf=uart_rxbuf)
+    baudrate = pl3.autodetect_baud(port)
+    if baudrate is None:
+        print('no response from the gun, using {} baud'.format(port.baudrate))
+    elif config.get('upgrade_baud', False) and baudrate != pl3.BAUD_RATES[0]:
+        baudrate = pl3.upgrade_baud(port)
+        print('gun is at {} baud'.format(baudrate))
+    content_cache_bytes = safe_int(config.get('content_cache_bytes', DEFAULT_CONTENT_CACHE_BYTES),
+                                   DEFAULT_CONTENT_CACHE_BYTES)
+    if content_cache_bytes < 0 or content_cache_bytes > 131072:
+        content_cache_bytes = DEFAULT_CONTENT_CACHE_BYTES
+    content_cache.max_bytes = content_cache_bytes
+    session = Pl3Session(port)
 
     if connected:
         ntp_time = ntp.get_ntp_time()
@@ -53,13 +53,148 @@ THEN...
 13 RESET
 
 """
+import binascii
+import json
+import struct
 import sys
+import time
+from collections import namedtuple
+
+if sys.implementation.name == 'micropython':
+    ticks_ms = time.ticks_ms
+    ticks_add = time.ticks_add
+    ticks_diff = time.ticks_diff
+else:
+    def ticks_ms():
+        return int(time.monotonic() * 1000)
+
+    def ticks_add(ticks, delta):
+        return ticks + delta
+
+    def ticks_diff(end, start):
+        return end - start
+
+try:
+    bytearray().find(0)
+
+    def _find_byte(buffer, value, start, end):
+        return buffer.find(value, start, end)
+except AttributeError:
+    # micropython's bytearray has no find(), and bytes.find() would need a copy of the range.
+    # scan the buffer as native code instead of running a bytecode loop per byte.
+    import micropython
+
+    @micropython.viper
+    def _find_byte(buffer, value: int, start: int, end: int) -> int:
+        data = ptr8(buffer)  # noqa: F821 -- viper builtin
+        i = start
+        while i < end:
+            if data[i] == value:
+                return i
+            i += 1
+        return -1
+
+
+# logging.  level checks happen before any formatting, so quiet costs nothing.
+LOG_NONE = 0
+LOG_ERROR = 1
+LOG_WARNING = 2
+LOG_INFO = 3
+LOG_DEBUG = 4
+log_level = LOG_INFO
+
+
+def console_sink(msg):
+    print(msg)
+
+
+class RingSink:
+    """
+    keeps the last size log messages in memory, for when the console is too slow to print to.
+    """
+
+    def __init__(self, size=32):
+        self.messages = [None] * size
+        self.count = 0
+
+    def __call__(self, msg):
+        self.messages[self.count % len(self.messages)] = msg
+        self.count += 1
+
+    def get_messages(self):
+        size = len(self.messages)
+        if self.count <= size:
+            return self.messages[:self.count]
+        start = self.count % size
+        return self.messages[start:] + self.messages[:start]
+
+
+class FileSink:
+    """
+    appends log messages to a file.
+    """
+
+    def __init__(self, filename):
+        self.file = open(filename, 'a')
+
+    def __call__(self, msg):
+        self.file.write(msg)
+        self.file.write('\n')
+
+    def close(self):
+        self.file.close()
+
+
+_log_sinks = [console_sink]
+
+
+def set_log_sinks(*sinks):
+    _log_sinks[:] = sinks
+
+
+def log(level, fmt, *args):
+    """
+    log fmt.format(*args) to all the sinks if level is enabled.  args are not touched when it is not.
+    """
+    if level > log_level:
+        return
+    msg = fmt.format(*args) if args else fmt
+    for sink in _log_sinks:
+        sink(msg)
+
+
+class _Hexes:
+    """
+    defers buffer_to_hexes() until the log message is actually formatted.
+    """
+    __slots__ = ('buffer',)
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+    def __str__(self):
+        return buffer_to_hexes(self.buffer)
+
+
+class _Hexdump(_Hexes):
+    __slots__ = ()
+
+    def __str__(self):
+        return hexdump_buffer(self.buffer)
+
+
+_CHECKSUM_MISMATCH = """
+---------------------------------------------------------------------------------------
+{} checksum mismatch, calculated {:02x} got {:02x}!
+{}
+---------------------------------------------------------------------------------------"""
 
 
 # message bytes
 START_OF_MESSAGE = 0x02
 END_OF_MESSAGE = 0x03
 MESSAGE_ESCAPE = 0x10
+MAX_MESSAGE_LENGTH = 600  # 260 byte responses, worst case every byte escaped, plus some slop.
 
 # command bytes
 
@@ -87,6 +222,13 @@ CMD_RESET = 0x13
 CMD_READING = 0x18  # this is a response message
 CMD_INIT_SPD4 = 0x19  # this is a response message
 
+ACK = True  # process_rx_frame() result for the responses that only acknowledge a command
+
+# CMD_READING message, 02 07 18 xx ss xx rl rh st cc 03
+READING_LENGTH = 11
+READING_OK = 0x01  # status byte for a good reading
+_READING_FORMAT = '<BBBHB'  # ?, speed, ?, range (feet * 10), status
+
 # known command data bytes
 MODE_SPEED = 0x00
 MODE_RANGE = 0x03
@@ -94,566 +236,1070 @@ MODE_RTR = 0x01
 
 # EEPROM data for Prolaser III
 #
-# right now this is both a memory map and a set of defaults.
+# the eeprom is big-endian.  EEPROM_FIELDS maps out the parts of it that are understood, _EEPROM_DEFAULTS is
+# a known good image.
 #
 EEPROM_LENGTH = 0xb7 + 1
-_eeprom_data = None
+EEPROM_MAGIC_ADDRESS = 0x01
+EEPROM_MAGIC = 0x12
+EEPROM_CHECKSUM_ADDRESS = 0xb7
+
+_EEPROM_DEFAULTS = (
+    b'\x00\x12\x07\x14\x08\x40\x07\x22\x08\x4e\x00\x00\x00\xdc\x00\x00'  # 00
+    b'\x00\x32\x00\x32\x07\xda\x00\x00\x03\xe8\x00\x00\x27\x10\x00\x1e'  # 10
+    b'\x4b\x00\x00\x0a\x00\x2b\x00\xb4\x00\x00\x00\x00\x00\x00\x00\x00'  # 20
+    b'\x01\x1e\x01\xa0\x00\x02\x78\xd0\x01\x68\x01\x4f\x00\x02\x26\xc8'  # 30 pulse filters
+    b'\x02\x05\x01\xab\x00\x05\x09\x10\x05\x78\x2c\x24\x00\xf1\x64\xd9'  # 40 pulse filters
+    b'\x00\x00\xe9\x4c\x66\x2a\x01\xf4\xe9\x4c\x66\x2a\x03\xe8\xe9\x4c'  # 50 range variance table
+    b'\x66\x2a\x0b\xb8\xe9\x4c\x66\x2a\x1b\x58\xe9\x4c\x66\x2a\x00\x00'  # 60 range variance table
+    b'\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00'  # 70 range variance table
+    b'\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x83\x3a\xf9\x28'  # 80
+    b'\x00\x50\x00\x52\x01\x54\x02\x55\x03\x57\x05\x58\x09\x5b\x0f\x5e'  # 90 HUD, reticle brightness pairs
+    b'\x58\x05\x05\x01\x03\x3c\x00\x03\x00\x02\x00\x01\x14\x0a\x02\x01'  # a0
+    b'\x00\x0a\x40\x14\x3c\x82\x50\xe0'  # b0
+)
+
+EepromField = namedtuple('EepromField', ('name', 'offset', 'format', 'scale'))
+
+# get() returns the stored value divided by scale, set() multiplies by it.
+EEPROM_FIELDS = (
+    EepromField('magic', 0x01, 'B', 1),
+    EepromField('tac_leading_low', 0x02, '>H', 1),  # tac/cal leading edge low value (1812)
+    EepromField('tac_leading_high', 0x04, '>H', 1),  # tac/cal leading edge high value (2112)
+    EepromField('tac_trailing_low', 0x06, '>H', 1),  # tac/cal trailing edge low value (1826)
+    EepromField('tac_trailing_high', 0x08, '>H', 1),  # tac/cal trailing edge high value (2126)
+    EepromField('range_offset', 0x0c, '>H', 100),  # feet
+    EepromField('speed_offset', 0x0e, '>H', 10),  # mph
+    EepromField('absolute_minimum_speed', 0x10, '>H', 10),  # mph
+    EepromField('minimum_speed', 0x12, '>H', 10),  # mph
+    EepromField('maximum_speed', 0x14, '>H', 10),  # mph
+    EepromField('minimum_range', 0x18, '>H', 100),  # feet
+    EepromField('maximum_range', 0x1c, '>H', 100),  # feet
+    EepromField('delta_speed', 0x1e, '>H', 10),  # kph
+    EepromField('baud_rate', 0x20, '>H', 1),  # literally the baud rate: 19200, 9600 or 4800
+    EepromField('continuity', 0x22, '>H', 1),
+    EepromField('minimum_number', 0x24, '>H', 1),
+    EepromField('maximum_number', 0x26, '>H', 1),
+    EepromField('display_lock_timeout', 0x28, '>H', 20),  # seconds
+    EepromField('sleep_timeout', 0x2a, '>H', 20),  # seconds
+    EepromField('power_off_timeout', 0x2c, '>H', 20),  # seconds
+    EepromField('fire_timeout', 0x2e, '>H', 25),  # seconds
+    EepromField('filter_1_min_pulse_width', 0x30, '>H', 1),
+    EepromField('filter_4_min_pulse_width', 0x48, '>H', 1),
+    EepromField('filter_4_offset', 0x4c, '>I', 1),
+    EepromField('range_variance_1', 0x50, '>H', 10),  # feet
+    EepromField('range_variance_2', 0x56, '>H', 10),  # feet
+    EepromField('range_variance_3', 0x5c, '>H', 10),  # feet
+    EepromField('range_variance_4', 0x62, '>H', 10),  # feet
+    EepromField('range_variance_5', 0x68, '>H', 10),  # feet
+    EepromField('reticle_brightness', 0xa0, 'B', 1),  # copy of the reticle value for the HUD brightness
+    EepromField('hud_brightness', 0xa1, 'B', 1),  # 0-7
+    EepromField('piezo_volume', 0xa2, 'B', 1),
+    EepromField('units', 0xa3, 'B', 1),  # 1: english, 2: SI, 3: knots/feet, 4: knots/meters, 5: ft/s, 6: m/s
+    EepromField('speed_type', 0xa4, 'B', 1),  # 1: approaching, 2: receding, 3: both
+    EepromField('update_rate', 0xa5, 'B', 1),
+    EepromField('operating_mode', 0xa6, 'B', 1),  # MODE_SPEED, MODE_RTR or MODE_RANGE
+    EepromField('operating_mode_flag', 0xa7, 'B', 1),  # 3 when operating_mode is 0
+    EepromField('display_lock', 0xa8, 'B', 1),
+    EepromField('speed_packet', 0xa9, 'B', 1),  # SPD2: 1, SPD3: 0, SPD4: 2
+    EepromField('first_speed_delta', 0xaa, 'B', 1),
+    EepromField('reset_sample_window', 0xab, 'B', 1),
+    EepromField('prefilter_count', 0xac, 'B', 1),
+    EepromField('good_data_percent', 0xad, 'B', 1),
+    EepromField('speeds_averaged', 0xae, 'B', 1),
+    EepromField('clock_start_compensation', 0xaf, 'B', 1),
+    EepromField('cfar', 0xb0, 'B', 1),
+    EepromField('minimum_range_set', 0xb1, 'B', 1),  # feet
+    EepromField('range_filter_1', 0xb3, 'B', 1),  # feet
+    EepromField('range_filter_2', 0xb4, 'B', 1),  # feet
+    EepromField('options', 0xb5, 'B', 1),  # OPTION_ bits
+    EepromField('data_quality_percent', 0xb6, 'B', 1),
+    EepromField('checksum', EEPROM_CHECKSUM_ADDRESS, 'B', 1),
+)
+_EEPROM_FIELDS_BY_NAME = {}
+for _field in EEPROM_FIELDS:
+    _EEPROM_FIELDS_BY_NAME[_field.name] = _field
+
+# bits in the options byte
+OPTION_SHORT_SERIAL_OUTPUT = 0x80
+OPTION_ITALIAN_TEXT = 0x10
+OPTION_CAMERA_MODE = 0x08
+OPTION_FRENCH_TEXT = 0x04
+OPTION_DISABLE_LCD_CHECKSUM = 0x02
+OPTION_TAC_CALIBRATE_WINDOW = 0x01  # does not stay on
 
 
 def get_eeprom_data():
-    global _eeprom_data
-    if _eeprom_data is None:
-        _eeprom_data = bytearray(EEPROM_LENGTH)
-
-        _eeprom_data[0x00] = 0x00
-        _eeprom_data[0x01] = 0x12  # magic value
-        _eeprom_data[0x02] = 0x07  # tac/cal leading edge low value MSB (0x07)
-        _eeprom_data[0x03] = 0x14  # tac/cal leading edge low value LSB (0x14)  (1812)
-        _eeprom_data[0x04] = 0x08  # tac/cal leading edge high value MSB (0x08)
-        _eeprom_data[0x05] = 0x40  # tac/cal leading edge high value LSB (0x40)  (2112)
-        _eeprom_data[0x06] = 0x07  # tac/cal trailing edge low value MSB (0x07)
-        _eeprom_data[0x07] = 0x22  # tac/cal trailing edge low value LSB (0x22) (1826)
-        _eeprom_data[0x08] = 0x08  # tac/cal trailing edge high value MSB (0x08)
-        _eeprom_data[0x09] = 0x4e  # tac/cal trailing edge high value LSB (0x4e) (2126)
-        _eeprom_data[0x0a] = 0x00  # ??? set to 01 does not affect poor environment
-        _eeprom_data[0x0b] = 0x00  # ??? set to 01 does not affect poor environment
-        _eeprom_data[0x0c] = 0x00  # range offset hi byte (# feet * 0x64)
-        _eeprom_data[0x0d] = 0xdc  # range offset lo byte
-        _eeprom_data[0x0e] = 0x00  # speed offset hi byte (mph * 10)
-        _eeprom_data[0x0f] = 0x00  # speed offset lo byte
-
-        _eeprom_data[0x10] = 0x00  # absolute minimum speed hi byte (mph * 10) -- set to 5
-        _eeprom_data[0x11] = 0x32  # absolute minimum speed lo byte
-        _eeprom_data[0x12] = 0x00  # minimum speed hi byte (mph * 10) -- set to 5
-        _eeprom_data[0x13] = 0x32  # minimum speed
-        _eeprom_data[0x14] = 0x07  # maximum speed hi byte (mph * 10) -- set to 201
-        _eeprom_data[0x15] = 0xda  # maximum speed lo byte (mph * 10)
-        _eeprom_data[0x16] = 0x00  # ??? set to 01 does not affect poor environment
-        _eeprom_data[0x17] = 0x00  # ??? set to 01 does not affect poor environment
-        _eeprom_data[0x18] = 0x03  # minimum range hi byte (feet * 0x64) -- set to 5
-        _eeprom_data[0x19] = 0xe8  # minimum range lo byte
-        _eeprom_data[0x1a] = 0x00  # ??? set to 01 does not affect poor environment
-        _eeprom_data[0x1b] = 0x00  # ??? set to 01 does not affect poor environment
-        _eeprom_data[0x1c] = 0x27  # max range hi byte (feet * 0x64) -- set to 100
-        _eeprom_data[0x1d] = 0x10  # max range lo byte
-        _eeprom_data[0x1e] = 0x00  # delta speed KPH (kph * 10) -- set to 3
-        _eeprom_data[0x1f] = 0x1e  # delta speed KPH
-
-        _eeprom_data[0x20] = 0x4b  # baud rate hi byte  19200=>4b, 9600=>25, 4800=>12 is literally the baud rate
-        _eeprom_data[0x21] = 0x00  # baud rate lo byte  19200=>00, 9600=>80, 4800=>c0
-        _eeprom_data[0x22] = 0x00  # continuity value MSB
-        _eeprom_data[0x23] = 0x0a  # continuity value LSB (10)
-        _eeprom_data[0x24] = 0x00  # minimum number MSB
-        _eeprom_data[0x25] = 0x2b  # minimum number LSB (43)
-        _eeprom_data[0x26] = 0x00  # maximum number MSB
-        _eeprom_data[0x27] = 0xb4  # maximum number LSB (180)
-        _eeprom_data[0x28] = 0x00  # display lock timeout MSB (0)
-        _eeprom_data[0x29] = 0x00  # display lock timeout LSB (0) # seconds * 20
-        _eeprom_data[0x2a] = 0x00  # sleep timeout MSB (0)
-        _eeprom_data[0x2b] = 0x00  # sleep timeout LSB (0)  # seconds * 20
-        _eeprom_data[0x2c] = 0x00  # power off timeout MSB (0)
-        _eeprom_data[0x2d] = 0x00  # Power off timeout LSB (0) # seconds * 20
-        _eeprom_data[0x2e] = 0x00  # gun fire timeout MSB (0)
-        _eeprom_data[0x2f] = 0x00  # gun fire timeout LSB (0) # seconds * 25 (!)
-
-        _eeprom_data[0x30] = 0x01  # filter # 1 min pulse width MSB (0x01)
-        _eeprom_data[0x31] = 0x1e  # filter # 1 min pulse width MSB (0x14) 28.6 ns
-        _eeprom_data[0x32] = 0x01  # filter
-        _eeprom_data[0x33] = 0xa0  # filter
-        _eeprom_data[0x34] = 0x00  # filter
-        _eeprom_data[0x35] = 0x02  # filter
-        _eeprom_data[0x36] = 0x78  # filter
-        _eeprom_data[0x37] = 0xd0  # filter
-        _eeprom_data[0x38] = 0x01  # filter
-        _eeprom_data[0x39] = 0x68  # filter
-        _eeprom_data[0x3a] = 0x01  # filter
-        _eeprom_data[0x3b] = 0x4f  # filter
-        _eeprom_data[0x3c] = 0x00  # filter
-        _eeprom_data[0x3d] = 0x02  # filter
-        _eeprom_data[0x3e] = 0x26  # filter
-        _eeprom_data[0x3f] = 0xc8  # filter
-
-        _eeprom_data[0x40] = 0x02  # filter
-        _eeprom_data[0x41] = 0x05  # filter
-        _eeprom_data[0x42] = 0x01  # filter
-        _eeprom_data[0x43] = 0xab  # filter
-        _eeprom_data[0x44] = 0x00  # filter
-        _eeprom_data[0x45] = 0x05  # filter
-        _eeprom_data[0x46] = 0x09  # filter
-        _eeprom_data[0x47] = 0x10  # filter
-        _eeprom_data[0x48] = 0x05  # filter # 4 min pulse width MSB (0x05) (140 nsec)
-        _eeprom_data[0x49] = 0x78  # filter # 4 min pulse width LSB (0x78 = 140 nsec)
-        _eeprom_data[0x4a] = 0x2c  # filter
-        _eeprom_data[0x4b] = 0x24  # filter
-        _eeprom_data[0x4c] = 0x00  # filter # 4 offset MSB
-        _eeprom_data[0x4d] = 0xf1  # filter
-        _eeprom_data[0x4e] = 0x64  # filter
-        _eeprom_data[0x4f] = 0xd9  # filter # 4 offset LSB
-
-        _eeprom_data[0x50] = 0x00  # range variance minimum 1 MSB
-        _eeprom_data[0x51] = 0x00  # range variance minimum 1 LSB (0) feet * 10.
-        _eeprom_data[0x52] = 0xe9  # range variance
-        _eeprom_data[0x53] = 0x4c  # range variance
-        _eeprom_data[0x54] = 0x66  # range variance
-        _eeprom_data[0x55] = 0x2a  # range variance
-        _eeprom_data[0x56] = 0x01  # range variance
-        _eeprom_data[0x57] = 0xf4  # range variance
-        _eeprom_data[0x58] = 0xe9  # range variance
-        _eeprom_data[0x59] = 0x4c  # range variance
-        _eeprom_data[0x5a] = 0x66  # range variance
-        _eeprom_data[0x5b] = 0x2a  # range variance
-        _eeprom_data[0x5c] = 0x03  # range variance
-        _eeprom_data[0x5d] = 0xe8  # range variance
-        _eeprom_data[0x5e] = 0xe9  # range variance
-        _eeprom_data[0x5f] = 0x4c  # range variance
-
-        _eeprom_data[0x60] = 0x66  # range variance
-        _eeprom_data[0x61] = 0x2a  # range variance
-        _eeprom_data[0x62] = 0x0b  # range variance
-        _eeprom_data[0x63] = 0xb8  # range variance
-        _eeprom_data[0x64] = 0xe9  # range variance
-        _eeprom_data[0x65] = 0x4c  # range variance
-        _eeprom_data[0x66] = 0x66  # range variance
-        _eeprom_data[0x67] = 0x2a  # range variance
-        _eeprom_data[0x68] = 0x1b  # range variance maximum 4 MSB
-        _eeprom_data[0x69] = 0x58  # range variance minimum 4 LSB (700) feet * 10.
-        _eeprom_data[0x6a] = 0xe9  # float value variance 4 MSB
-        _eeprom_data[0x6b] = 0x4c  # range variance
-        _eeprom_data[0x6c] = 0x66  # range variance
-        _eeprom_data[0x6d] = 0x2a  # float value variance 4 LSB (0.199999998765385)
-        _eeprom_data[0x6e] = 0x00  # range variance maximum 5 MSB
-        _eeprom_data[0x6f] = 0x00  # range variance maximum 5 LSB
-
-        _eeprom_data[0x70] = 0x00  # range variance
-        _eeprom_data[0x71] = 0x00  # range variance
-        _eeprom_data[0x72] = 0x00  # range variance
-        _eeprom_data[0x73] = 0x00  # range variance
-        _eeprom_data[0x74] = 0x00  # range variance
-        _eeprom_data[0x75] = 0x00  # range variance
-        _eeprom_data[0x76] = 0x00  # range variance
-        _eeprom_data[0x77] = 0x00  # range variance
-        _eeprom_data[0x78] = 0x00  # range variance
-        _eeprom_data[0x79] = 0x00  # range variance
-        _eeprom_data[0x7a] = 0x00  # range variance
-        _eeprom_data[0x7b] = 0x00  # range variance
-        _eeprom_data[0x7c] = 0x00  # range variance
-        _eeprom_data[0x7d] = 0x00  # range variance
-        _eeprom_data[0x7e] = 0x00  # range variance
-        _eeprom_data[0x7f] = 0x00  # range variance
-
-        _eeprom_data[0x80] = 0x00  # range variance
-        _eeprom_data[0x81] = 0x00  # range variance
-        _eeprom_data[0x82] = 0x00  # range variance
-        _eeprom_data[0x83] = 0x00  # range variance
-        _eeprom_data[0x84] = 0x00  # range variance
-        _eeprom_data[0x85] = 0x00  # range variance
-        _eeprom_data[0x86] = 0x00  # range variance
-        _eeprom_data[0x87] = 0x00  # range variance
-        _eeprom_data[0x88] = 0x00  # range variance
-        _eeprom_data[0x89] = 0x00  # range variance
-        _eeprom_data[0x8a] = 0x00  # range variance
-        _eeprom_data[0x8b] = 0x00  # end of range/variance data
-        _eeprom_data[0x8c] = 0x83
-        _eeprom_data[0x8d] = 0x3a
-        _eeprom_data[0x8e] = 0xf9
-        _eeprom_data[0x8f] = 0x28
-
-        _eeprom_data[0x90] = 0x00  # HUD [0] (0)
-        _eeprom_data[0x91] = 0x50  # Reticle [0] (80)
-        _eeprom_data[0x92] = 0x00  # HUD [1] (0)
-        _eeprom_data[0x93] = 0x52  # Reticle [0] (82)
-        _eeprom_data[0x94] = 0x01  # HUD [2] (1)
-        _eeprom_data[0x95] = 0x54  # Reticle [2] (84)
-        _eeprom_data[0x96] = 0x02  # HUD [2] (2)
-        _eeprom_data[0x97] = 0x55  # Reticle [3] (85)
-        _eeprom_data[0x98] = 0x03  # HUD [3] (3)
-        _eeprom_data[0x99] = 0x57  # Reticle [4] (87)
-        _eeprom_data[0x9a] = 0x05  # HUD [4] (5)
-        _eeprom_data[0x9b] = 0x58  # Reticle [4] (88)
-        _eeprom_data[0x9c] = 0x09  # HUD [5] (9)
-        _eeprom_data[0x9d] = 0x5b  # Reticle [5] (91)
-        _eeprom_data[0x9e] = 0x0f  # HUD [6] (15)
-        _eeprom_data[0x9f] = 0x5e  # Reticle [6] (94)
-
-        _eeprom_data[0xa0] = 0x58  # --> brightness 7: hud bright 6: 5b, 5: 58, 4: 57, 3: 55, 2: 54, 1: 52, 0: 50 (58)
-        _eeprom_data[0xa1] = 0x05  # HUD brightness level (5)
-        _eeprom_data[0xa2] = 0x05  # piezo volume level (5)
-        _eeprom_data[0xa3] = 0x01  # units. 01: english, 02: SI, 03: knots/feet, 04: knots/meters, 05: feet/sec, 06: meters/sec
-        _eeprom_data[0xa4] = 0x03  # speed type. 01: approaching. 02: receding, 03: both
-        _eeprom_data[0xa5] = 0x3c  # update rate (60)
-        _eeprom_data[0xa6] = 0x00  # operating mode: 00: speed, 01: RTR, 03: range
-        _eeprom_data[0xa7] = 0x03  # set to 03 when above is 0, literally  (-(eeprom[0xa6] != '\0') & 0xfdU) + 3;
-        _eeprom_data[0xa8] = 0x00  # display lock enable when 01
-        _eeprom_data[0xa9] = 0x02  # speed packet op code: SPD2: 01, SPD3: 00, SPD4: 02
-        _eeprom_data[0xaa] = 0x00  # use first speed delta, value is 01 when selected
-        _eeprom_data[0xab] = 0x01  # reset sample window when 01.
-        _eeprom_data[0xac] = 0x14  # prefilter count
-        _eeprom_data[0xad] = 0x0a  # good data % (10)
-        _eeprom_data[0xae] = 0x02  # number of speeds averaged.
-        _eeprom_data[0xaf] = 0x01  # clock start compensation, 1 is on, 0 is off, other bits do not affect poor env mode
-
-        _eeprom_data[0xb0] = 0x00  # CFAR toggle, 1 is on, 0 is off, other bits do not affect poor env mode
-        _eeprom_data[0xb1] = 0x0a  # min range set (single byte value?)  10 feet
-        _eeprom_data[0xb2] = 0x40  # 64 what?
-        _eeprom_data[0xb3] = 0x14  # range filter #1, feet -- this is 20
-        _eeprom_data[0xb4] = 0x3c  # range filter #2, feet -- this is 80
-        _eeprom_data[0xb5] = 0x82  # bit-mapped options: 1000 0010
-                                # 7 10000000 short serial output
-                                # 6 01000000 not used? tested, does not affect poor env.
-                                # 5 00100000 not used? tested, does not affect poor env.
-                                # 4 00010000 Italian text
-                                # 3 00001000 camera mode
-                                # 2 00000100 French text
-                                # 1 00000010 disable checksum on lcd
-                                # 0 00000001 enable calculate tac calibrate window (does not stay on)
-        _eeprom_data[0xb6] = 0x50  # data quality % literal value.
-        eeprom_checksum = 0
-        for address in range(0, 0xb7):
-            eeprom_checksum = (eeprom_checksum + _eeprom_data[address]) & 0x00ff
-        _eeprom_data[0xb7] = eeprom_checksum  # CHECKSUM!
-    return _eeprom_data
+    """
+    the default eeprom image, as read-only bytes.  use bytearray(get_eeprom_data()) for a copy to change.
+    """
+    return _EEPROM_DEFAULTS
+
+
+def eeprom_checksum(data):
+    """
+    the checksum stored at EEPROM_CHECKSUM_ADDRESS, the low byte of the sum of all the bytes before it.
+    """
+    checksum = 0
+    for address in range(EEPROM_CHECKSUM_ADDRESS):
+        checksum += data[address]
+    return checksum & 0x00ff
+
+
+class EepromImage:
+    """
+    a shadow copy of the device eeprom, the defaults if data is None.
+    read_time is time.time() and read_ticks is ticks_ms() when the image was read.
+    fields in EEPROM_FIELDS are read and written in place with get() and set(), which keep the checksum byte
+    up to date.
+    """
+
+    def __init__(self, data=None, read_time=None, read_ticks=None):
+        self.data = bytearray(_EEPROM_DEFAULTS if data is None else data)
+        self.read_time = time.time() if read_time is None else read_time
+        self.read_ticks = ticks_ms() if read_ticks is None else read_ticks
+
+    @property
+    def device_id(self):
+        return self.data[EEPROM_MAGIC_ADDRESS]
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, address):
+        return self.data[address]
+
+    def __setitem__(self, address, value):
+        if address == EEPROM_CHECKSUM_ADDRESS:
+            raise ValueError('checksum is maintained automatically')
+        data = self.data
+        data[EEPROM_CHECKSUM_ADDRESS] = (data[EEPROM_CHECKSUM_ADDRESS] + value - data[address]) & 0x00ff
+        data[address] = value
+
+    def checksum_ok(self):
+        return eeprom_checksum(self.data) == self.data[EEPROM_CHECKSUM_ADDRESS]
+
+    def age_ms(self):
+        return ticks_diff(ticks_ms(), self.read_ticks)
+
+    def get_raw(self, name):
+        field = _EEPROM_FIELDS_BY_NAME[name]
+        return struct.unpack_from(field.format, self.data, field.offset)[0]
+
+    def get(self, name):
+        field = _EEPROM_FIELDS_BY_NAME[name]
+        value = struct.unpack_from(field.format, self.data, field.offset)[0]
+        return value if field.scale == 1 else value / field.scale
+
+    def set_raw(self, name, value):
+        field = _EEPROM_FIELDS_BY_NAME[name]
+        if field.offset == EEPROM_CHECKSUM_ADDRESS:
+            raise ValueError('checksum is maintained automatically')
+        data = self.data
+        end = field.offset + struct.calcsize(field.format)
+        delta = 0
+        for address in range(field.offset, end):
+            delta -= data[address]
+        struct.pack_into(field.format, data, field.offset, value)
+        for address in range(field.offset, end):
+            delta += data[address]
+        data[EEPROM_CHECKSUM_ADDRESS] = (data[EEPROM_CHECKSUM_ADDRESS] + delta) & 0x00ff
+
+    def set(self, name, value):
+        scale = _EEPROM_FIELDS_BY_NAME[name].scale
+        self.set_raw(name, value if scale == 1 else int(round(value * scale)))
+
+    def fields(self):
+        result = {}
+        for field in EEPROM_FIELDS:
+            result[field.name] = self.get(field.name)
+        return result
+
+    def to_json(self):
+        return json.dumps({'device_id': self.device_id,
+                           'read_time': self.read_time,
+                           'data': binascii.hexlify(self.data).decode(),
+                           'fields': self.fields(),
+                           })
+
+    @classmethod
+    def from_json(cls, s):
+        """
+        build an image from to_json() output.  'data' is the starting point, defaults if it is missing, then
+        any 'fields' that differ from it are applied, so hand edited fields take effect.
+        """
+        d = json.loads(s)
+        data = d.get('data')
+        image = cls(None if data is None else binascii.unhexlify(data), read_time=d.get('read_time'))
+        if len(image.data) != EEPROM_LENGTH:
+            raise ValueError('eeprom image is {} bytes, expected {}'.format(len(image.data), EEPROM_LENGTH))
+        fields = d.get('fields') or {}
+        for name in fields:
+            if name != 'checksum' and name in _EEPROM_FIELDS_BY_NAME and fields[name] != image.get(name):
+                image.set(name, fields[name])
+        return image
+
+
+class Reading:
+    """
+    a decoded CMD_READING message.  range is in tenths of a foot, ticks is ticks_ms() when it was decoded.
+    """
+    __slots__ = ('speed', 'range', 'status', 'ticks', 'payload')
+
+    def __init__(self, speed, rng, status, ticks, payload):
+        self.speed = speed
+        self.range = rng
+        self.status = status
+        self.ticks = ticks
+        self.payload = payload
+
+    def feet(self):
+        return self.range / 10.0
+
+    def hex(self):
+        return buffer_to_hexes(self.payload)
+
+    def __str__(self):
+        return '{} {} {}'.format(self.hex(), self.feet(), self.speed)
+
+    def __repr__(self):
+        return 'Reading({})'.format(self)
+
+
+def decode_reading(buffer):
+    """
+    decode an unescaped CMD_READING frame.  buffer may be bytes, bytearray, memoryview or a list of ints.
+    returns None if the frame is too short to hold a reading.
+    """
+    if len(buffer) < READING_LENGTH:
+        return None
+    if isinstance(buffer, list):
+        buffer = bytes(buffer)  # struct.unpack_from() needs a buffer
+    _, speed, _, rng, status = struct.unpack_from(_READING_FORMAT, buffer, 3)
+    if speed == 0xff:
+        speed = 0
+    return Reading(speed, rng, status, ticks_ms(), bytes(buffer[3:-2]))
+
+
+# what hexdump_buffer() shows for each byte value.
+_PRINTABLE = tuple(chr(b) if 32 <= b <= 126 else '.' for b in range(256))
 
 
 def buffer_to_hexes(buffer):
-    return ' '.join('{:02x}'.format(b) for b in buffer)
-
-
-def hexdump_buffer(buffer):
-    result = ''
-    hex_bytes = ''
-    printable = ''
-    offset = 0
-    ofs = '{:04x}'.format(offset)
-    for b in buffer:
-        hex_bytes += '{:02x} '.format(b)
-        printable += chr(b) if 32 <= b <= 126 else '.'
-        offset += 1
-        if len(hex_bytes) >= 48:
-            result += ofs + '  ' + hex_bytes + '  ' + printable +'\n'
-            hex_bytes = ''
-            printable = ''
-            ofs = '{:04x}'.format(offset)
-    if len(hex_bytes) > 0:
-        hex_bytes += ' ' * 47
-        hex_bytes = hex_bytes[0:47]
-        result += ofs + '  ' + hex_bytes + '   ' + printable + '\n'
-    return result
+    if isinstance(buffer, list):
+        buffer = bytes(buffer)
+    return binascii.hexlify(buffer, ' ').decode()
+
+
+def hexdump_buffer(buffer, sink=None):
+    """
+    hex dump buffer, 16 bytes per line.  lines are written to sink (anything with a write()) as they are made,
+    or returned as one string when there is no sink.
+    """
+    if isinstance(buffer, list):
+        buffer = bytes(buffer)
+    lines = None
+    if sink is None:
+        lines = []
+        write = lines.append
+    else:
+        write = sink.write
+    mv = memoryview(buffer)
+    printable = _PRINTABLE
+    for offset in range(0, len(mv), 16):
+        chunk = mv[offset:offset + 16]
+        write('{:04x}  {:<47}   {}\n'.format(offset,
+                                              binascii.hexlify(chunk, ' ').decode(),
+                                              ''.join([printable[b] for b in chunk])))
+    if lines is not None:
+        return ''.join(lines)
 
 
 def dump_buffer(name, buffer, dump_all=False):
     if len(buffer) < 5:
         dump_all = True
     if dump_all:
-        print('{} message {}'.format(name, buffer_to_hexes(buffer)))
+        log(LOG_INFO, '{} message {}', name, _Hexes(buffer))
     else:
-        print('{} payload {}'.format(name, buffer_to_hexes(buffer[2:-2])))
-
-
-def _build_message(buffer):
-    msg = bytearray()
-    msg.append(START_OF_MESSAGE)
-    lb = len(buffer)
-    checksum = lb
-    msg.append(lb)
-    for b in buffer:
-        if b == END_OF_MESSAGE or b == MESSAGE_ESCAPE:
-            msg.append(MESSAGE_ESCAPE)
-        msg.append(b)
-        checksum = (checksum + b) & 0x00ff
-    if checksum == END_OF_MESSAGE or checksum == MESSAGE_ESCAPE:
-        msg.append(MESSAGE_ESCAPE)
-    msg.append(checksum)
-    msg.append(END_OF_MESSAGE)
-    if not validate_checksum('tx', msg):
-        print('shit! checksum mismatch: {}'.format(buffer_to_hexes(msg)), file=sys.stderr)
+        log(LOG_INFO, '{} payload {}', name, _Hexes(buffer[2:-2]))
+
+
+# non-zero for the bytes that must be escaped on the wire.
+_ESCAPE_TABLE = bytearray(256)
+_ESCAPE_TABLE[END_OF_MESSAGE] = 1
+_ESCAPE_TABLE[MESSAGE_ESCAPE] = 1
+
+
+def build_into(dst, payload):
+    """
+    build the message for payload into dst, a bytearray or memoryview with room for 2 * len(payload) + 6 bytes.
+    escaping and checksum are done in one pass.  returns the length of the message.
+    """
+    escape = _ESCAPE_TABLE
+    lp = len(payload)
+    checksum = lp
+    dst[0] = START_OF_MESSAGE
+    i = 1
+    if escape[lp]:
+        dst[i] = MESSAGE_ESCAPE
+        i += 1
+    dst[i] = lp
+    i += 1
+    for b in payload:
+        if escape[b]:
+            dst[i] = MESSAGE_ESCAPE
+            i += 1
+        dst[i] = b
+        i += 1
+        checksum += b
+    checksum &= 0x00ff
+    if escape[checksum]:
+        dst[i] = MESSAGE_ESCAPE
+        i += 1
+    dst[i] = checksum
+    dst[i + 1] = END_OF_MESSAGE
+    return i + 2
+
+
+def _build_message(buffer, check=False):
+    msg = bytearray(2 * len(buffer) + 6)
+    msg = msg[:build_into(msg, buffer)]
+    if check and validate_checksum('tx', msg) is None:
+        log(LOG_ERROR, 'shit! checksum mismatch: {}', _Hexes(msg))
     return msg
 
 
-def _unescape_message(message):
-    result = []
-    escaped = False
-    for b in message:
-        if b == MESSAGE_ESCAPE:
-            if escaped:
-                result.append(b)
-                escaped = False
-            else:
-                escaped = True
-        else:
-            escaped = False
-            result.append(b)
-    return result
+def unescape_frame(dst, src, start=0, stop=None, src_mv=None):
+    """
+    unescape the message in src[start:stop] into dst, a memoryview, summing the checksum in the same pass.
+    returns the unescaped frame and the checksum calculated for it, None if the frame is too short to have one.
+    the frame is a memoryview into dst, or into src when there was nothing to unescape.
+    """
+    if stop is None:
+        stop = len(src)
+    if src_mv is None:
+        src_mv = memoryview(src)
+    esc = _find_byte(src, MESSAGE_ESCAPE, start, stop)
+    if esc < 0:
+        frame = src_mv[start:stop]  # nothing escaped, no copy.
+        total = sum(frame)
+    else:
+        length = 0
+        total = 0
+        while esc >= 0:
+            count = esc - start
+            segment = src_mv[start:esc]
+            dst[length:length + count] = segment
+            total += sum(segment)
+            if esc + 1 >= stop:  # dangling escape at the very end, drop it.
+                length += count
+                start = stop
+                break
+            b = src[esc + 1]
+            dst[length + count] = b
+            total += b
+            length += count + 1
+            start = esc + 2
+            esc = _find_byte(src, MESSAGE_ESCAPE, start, stop)
+        count = stop - start
+        segment = src_mv[start:stop]
+        dst[length:length + count] = segment
+        total += sum(segment)
+        frame = dst[:length + count]
+    if len(frame) < 5:
+        return frame, None
+    # the checksum covers everything but START_OF_MESSAGE, the checksum and END_OF_MESSAGE.
+    return frame, (total - frame[0] - frame[-2] - frame[-1]) & 0x00ff
+
+
+class FrameDecoder:
+    """
+    incremental decoder for the framed serial stream.
+
+    feed() it bytes as they arrive, it yields complete, unescaped, checksum-verified frames,
+    START_OF_MESSAGE through END_OF_MESSAGE.  the frames are memoryviews into the decoder's
+    buffers, so they are only good until the next call to feed().
+    """
+
+    def __init__(self, size=MAX_MESSAGE_LENGTH, name='rx'):
+        self.name = name
+        self.bad_frames = 0
+        self._raw = bytearray(size)
+        self._raw_mv = memoryview(self._raw)
+        self._frame_mv = memoryview(bytearray(size))
+        self._start = 0  # first byte of the frame being assembled in _raw
+        self._end = 0  # end of received data in _raw
+        self._scan = 0  # resume looking for END_OF_MESSAGE here
+
+    def reset(self):
+        self._start = 0
+        self._end = 0
+        self._scan = 0
+
+    def feed(self, buf, n=None):
+        if n is None:
+            n = len(buf)
+        src = memoryview(buf)
+        size = len(self._raw)
+        pos = 0
+        while True:
+            if pos < n:
+                if self._start > 0:
+                    # move the partial frame to the front of the buffer
+                    remaining = self._end - self._start
+                    if remaining > 0:
+                        self._raw[0:remaining] = self._raw[self._start:self._end]
+                    self._scan -= self._start
+                    self._end = remaining
+                    self._start = 0
+                if self._end == size:
+                    log(LOG_WARNING, '{} too much data, {} bytes without a message', self.name, size)
+                    self.bad_frames += 1
+                    self.reset()
+                count = size - self._end
+                if count > n - pos:
+                    count = n - pos
+                self._raw_mv[self._end:self._end + count] = src[pos:pos + count]
+                self._end += count
+                pos += count
+            while True:
+                frame = self._next_frame()
+                if frame is None:
+                    break
+                yield frame
+            if pos >= n:
+                return
+
+    def _next_frame(self):
+        raw = self._raw
+        while True:
+            start = self._start
+            end = self._end
+            if start >= end:
+                return None
+            if raw[start] != START_OF_MESSAGE:
+                # junk between messages, skip to the next start of message.
+                start = _find_byte(raw, START_OF_MESSAGE, start, end)
+                if start < 0:
+                    self._start = end
+                    self._scan = end
+                    return None
+                self._start = start
+            scan = self._scan if self._scan > start else start + 1
+            while True:
+                etx = _find_byte(raw, END_OF_MESSAGE, scan, end)
+                if etx < 0:
+                    self._scan = end
+                    return None
+                # an odd number of escapes in front of the END_OF_MESSAGE means it is data.
+                i = etx - 1
+                while i > start and raw[i] == MESSAGE_ESCAPE:
+                    i -= 1
+                if (etx - 1 - i) & 1 == 0:
+                    break
+                scan = etx + 1
+            self._start = etx + 1
+            self._scan = etx + 1
+            frame = self._unescape(start, etx + 1)
+            if frame is not None:
+                return frame
+
+    def _unescape(self, start, stop):
+        frame, checksum = unescape_frame(self._frame_mv, self._raw, start, stop, self._raw_mv)
+        if checksum is None:
+            log(LOG_WARNING, '{} message too short: {}: {}', self.name, len(frame), _Hexes(frame))
+            self.bad_frames += 1
+            return None
+        if checksum != frame[-2]:
+            log(LOG_WARNING, _CHECKSUM_MISMATCH, self.name, checksum, frame[-2], _Hexdump(frame))
+            self.bad_frames += 1
+            return None
+        return frame
+
+
+_receive_decoders = {}
 
 
 def process_tx_buffer(buffer, verbosity=5):
-    command = None
-    result = None
-    if len(buffer) < 5:
-        print('message too short: {}: {}'.format(len(buffer), buffer_to_hexes(buffer)))
-        return command, result
-    if not validate_checksum('tx', buffer):
-        return command, result
+    frame = validate_checksum('tx', buffer)
+    if frame is None:
+        return None, None
+    return process_tx_frame(frame, verbosity=verbosity)
+
+
+# command decoders.  handler(frame, verbosity) gets the unescaped, checksum-verified frame
+# and returns the decoded result.
+_tx_handlers = [None] * 256
+_rx_handlers = [None] * 256
+_MODE_NAMES = {MODE_SPEED: 'Speed', MODE_RTR: 'RTR', MODE_RANGE: 'Range'}
 
-    buffer = _unescape_message(buffer)
+EepromData = namedtuple('EepromData', ('address', 'data'))
+
+
+def register_tx_handler(command, handler):
+    _tx_handlers[command] = handler
+
+
+def register_rx_handler(command, handler):
+    _rx_handlers[command] = handler
+
+
+def process_tx_frame(buffer, verbosity=5):
+    """
+    decode an unescaped, checksum-verified tx frame, like the ones FrameDecoder.feed() returns.
+    """
     command = buffer[2]
-    if command == CMD_EXIT_REMOTE:
-        if verbosity >= 4:
-            print('tx CMD_EXIT_REMOTE')
-    elif command == CMD_WHO_ARE_YOU:
-        if verbosity >= 4:
-            print('tx CMD_WHO_ARE_YOU')
-    elif command == CMD_READ_RAM:
-        if verbosity >= 4:
-            print('tx CMD_READ_RAM: {}'.format(buffer_to_hexes(buffer)))
-    elif command == CMD_ENABLE_REMOTE:
-        if verbosity >= 4:
-            print('tx CMD_ENABLE_REMOTE')
-    elif command == CMD_TOGGLE_LASER:
-        if verbosity >= 4:
-            print('tx CMD_TOGGLE_LASER (on/off?)')
-    elif command == CMD_SET_MODE:
-        sub_command = buffer[3]
-        result = sub_command
-        if sub_command == MODE_SPEED:
-            if verbosity >= 4:
-                print('tx CMD_SET_MODE Speed')
-        elif sub_command == MODE_RTR:
-            if verbosity >= 4:
-                print('tx CMD_SET_MODE RTR')
-        elif sub_command == MODE_RANGE:
-            if verbosity >= 4:
-                print('tx CMD_SET_MODE_RANGE Set mode Range')
-        else:
-            print('tx CMD_SET_MODE_RANGE unknown mode {:02x}'.format(sub_command))
-    elif command == CMD_READ_EEPROM:
-        addr = buffer[3]
-        if verbosity > 4:
-            print('tx CMD_READ_EEPROM address {:02x}'.format(addr))
-            result = addr
-    elif command == CMD_WRITE_EEPROM:
-        if buffer[3] == 0x80:
-            addr = buffer[4]
-            data = buffer[5]
-            result = (addr, data)
-            if verbosity > 4:
-                print('tx CMD_WRITE_EEPROM address {:02x} data {:02x}'.format(addr, data))
-                if addr == 0xb7:  # checksum byte
-                    checksum = 0
-                    for ca in range(0, 0xb7):
-                        checksum = (checksum + _eeprom_data[ca]) & 0x00ff
-                    print('   calculated checksum {:02x}, checksum={:02x}'.format(checksum, data))
-        else:
-            print('tx unhandled command {:02x} in {}'.format(command, buffer_to_hexes(buffer)))
-    elif command == CMD_RESET:
-        if verbosity >= 4:
-            print('tx CMD_RESET')
-    else:
-        print('tx unhandled command {:02x} in {}'.format(command, buffer_to_hexes(buffer)))
-        command = None
-    return command, result
+    handler = _tx_handlers[command]
+    if handler is None:
+        log(LOG_WARNING, 'tx unhandled command {:02x} in {}', command, _Hexes(buffer))
+        return None, None
+    return command, handler(buffer, verbosity)
+
+
+def _tx_exit_remote(buffer, verbosity):
+    if verbosity >= 4:
+        log(LOG_INFO, 'tx CMD_EXIT_REMOTE')
+
+
+def _tx_who_are_you(buffer, verbosity):
+    if verbosity >= 4:
+        log(LOG_INFO, 'tx CMD_WHO_ARE_YOU')
+
+
+def _tx_read_ram(buffer, verbosity):
+    if verbosity >= 4:
+        log(LOG_INFO, 'tx CMD_READ_RAM: {}', _Hexes(buffer))
+
+
+def _tx_enable_remote(buffer, verbosity):
+    if verbosity >= 4:
+        log(LOG_INFO, 'tx CMD_ENABLE_REMOTE')
+
+
+def _tx_toggle_laser(buffer, verbosity):
+    if verbosity >= 4:
+        log(LOG_INFO, 'tx CMD_TOGGLE_LASER (on/off?)')
+
+
+def _tx_set_mode(buffer, verbosity):
+    mode = buffer[3]
+    name = _MODE_NAMES.get(mode)
+    if name is None:
+        log(LOG_WARNING, 'tx CMD_SET_MODE unknown mode {:02x}', mode)
+    elif verbosity >= 4:
+        log(LOG_INFO, 'tx CMD_SET_MODE {}', name)
+    return mode
+
+
+def _tx_read_eeprom(buffer, verbosity):
+    addr = buffer[3]
+    if verbosity > 4:
+        log(LOG_INFO, 'tx CMD_READ_EEPROM address {:02x}', addr)
+    return addr
+
+
+def _tx_write_eeprom(buffer, verbosity):
+    if buffer[3] != 0x80:
+        log(LOG_WARNING, 'tx unhandled command {:02x} in {}', buffer[2], _Hexes(buffer))
+        return None
+    addr = buffer[4]
+    data = buffer[5]
+    if verbosity > 4:
+        log(LOG_INFO, 'tx CMD_WRITE_EEPROM address {:02x} data {:02x}', addr, data)
+        if addr == 0xb7:  # checksum byte
+            eeprom_data = get_eeprom_data()
+            checksum = 0
+            for ca in range(0, 0xb7):
+                checksum = (checksum + eeprom_data[ca]) & 0x00ff
+            log(LOG_INFO, '   calculated checksum {:02x}, checksum={:02x}', checksum, data)
+    return EepromData(addr, data)
+
+
+def _tx_reset(buffer, verbosity):
+    if verbosity >= 4:
+        log(LOG_INFO, 'tx CMD_RESET')
+
+
+register_tx_handler(CMD_EXIT_REMOTE, _tx_exit_remote)
+register_tx_handler(CMD_READ_RAM, _tx_read_ram)
+register_tx_handler(CMD_WHO_ARE_YOU, _tx_who_are_you)
+register_tx_handler(CMD_ENABLE_REMOTE, _tx_enable_remote)
+register_tx_handler(CMD_TOGGLE_LASER, _tx_toggle_laser)
+register_tx_handler(CMD_SET_MODE, _tx_set_mode)
+register_tx_handler(CMD_READ_EEPROM, _tx_read_eeprom)
+register_tx_handler(CMD_WRITE_EEPROM, _tx_write_eeprom)
+register_tx_handler(CMD_RESET, _tx_reset)
 
 
 def process_rx_buffer(buffer, verbosity=5):
-    result = None
-    command = None
-    if len(buffer) < 5:
-        print('message too short: {}: {}'.format(len(buffer), buffer_to_hexes(buffer)))
-        return command, result
-    if not validate_checksum('rx', buffer):
-        return command, result
-    buffer = _unescape_message(buffer)
+    frame = validate_checksum('rx', buffer)
+    if frame is None:
+        return None, None
+    return process_rx_frame(frame, verbosity=verbosity)
+
+
+def process_rx_frame(buffer, verbosity=5):
+    """
+    decode an unescaped, checksum-verified rx frame, like the ones FrameDecoder.feed() returns.
+    """
     command = buffer[2]
-    if command == CMD_EXIT_REMOTE:
-        if verbosity > 4:
-            print('rx ACK CMD_EXIT_REMOTE')
-        result = 'ACK CMD_EXIT_REMOTE'
-    elif command == CMD_READ_RAM:
-        print('rx CMD_READ_RAM response: {}'.format(buffer_to_hexes(buffer)))
-        result = buffer[3:-2]
-    elif command == CMD_ENABLE_REMOTE:
-        if verbosity > 4:
-            print('rx ACK CMD_ENABLE_REMOTE')
-        result = 'ACK CMD_ENABLE_REMOTE'
-    elif command == CMD_TOGGLE_LASER:
-        if verbosity > 4:
-            print('rx ACK CMD_TOGGLE_LASER (off)')
-    elif command == CMD_SET_MODE:
-        sub_command = buffer[3]
-        result = sub_command
-        if sub_command == MODE_SPEED:
-            if verbosity > 4:
-                print('rx ACK CMD_SET_MODE Speed')
-        elif sub_command == MODE_RTR:
-            if verbosity > 4:
-                print('rx ACK CMD_SET_MODE RTR')
-        elif sub_command == MODE_RANGE:
-            if verbosity > 4:
-                print('rx ACK CMD_SET_MODE Range')
-        else:
-            print('rx ACK CMD_SET_MODE unknown mode {:02x}'.format(sub_command))
-    elif command == CMD_READ_EEPROM:
-        addr = buffer[4]
-        data = buffer[5]
-        result = (addr, data)
-        if verbosity > 4:
-            print('rx CMD_READ_EEPROM response address {:02x} data {:02x}'.format(addr, data))
-    elif command == CMD_WRITE_EEPROM:
-        sub_command = buffer[3]
-        if sub_command == 0x00:
-            addr = buffer[4]
-            result = addr
-            if verbosity > 4:
-                print('rx CMD_WRITE_EEPROM response {:02x}'.format(addr))
-        else:
-            print('rx CMD_WRITE_EEPROM response unhandled subcommand {:02x} in {}'.format(sub_command,
-                                                                                          buffer_to_hexes(buffer)))
-    elif command == CMD_READING:
-        if buffer[8] == 0x01:
-            speed = buffer[4] if buffer[4] != 0xff else 0
-            rng = (buffer[6] + 256 * buffer[7]) / 10.0
-            if verbosity > 2:
-                print('rx CMD_READING: {} : {:5.1f} feet {} mph'.format(buffer_to_hexes(buffer[3:-2]), rng, speed))
-            result = (buffer_to_hexes(buffer[3:-2]), rng, speed)
-        else:
-            warn = 'CMD_READING: {}'.format(buffer_to_hexes(buffer[3:-2]))
-            print('rx ' + warn)
-            result = warn
-    elif command == CMD_INIT_SPD23:
-        start = 3
-        while buffer[start] < 0x20:
-            start += 1
-        stuff = buffer[start:-2]
-        if verbosity > 3:
-            print('rx CMD_INIT_SPD23 text payload follows:')
-            print(stuff)
-        result = stuff
-    elif command == CMD_INIT_SPD4:
-        if verbosity > 3:
-            print('rx CMD_INIT_SPD4 text payload follows:')
-            print(hexdump_buffer(buffer[3:-2]))
-        result = str(buffer[3:-2])
+    handler = _rx_handlers[command]
+    if handler is None:
+        log(LOG_WARNING, 'rx unhandled command {:02x} in {}', command, _Hexes(buffer))
+        return command, bytes(buffer[3:-2])
+    return command, handler(buffer, verbosity)
+
+
+def _rx_exit_remote(buffer, verbosity):
+    if verbosity > 4:
+        log(LOG_INFO, 'rx ACK CMD_EXIT_REMOTE')
+    return ACK
+
+
+def _rx_read_ram(buffer, verbosity):
+    log(LOG_INFO, 'rx CMD_READ_RAM response: {}', _Hexes(buffer))
+    return bytes(buffer[3:-2])
+
+
+def _rx_enable_remote(buffer, verbosity):
+    if verbosity > 4:
+        log(LOG_INFO, 'rx ACK CMD_ENABLE_REMOTE')
+    return ACK
+
+
+def _rx_toggle_laser(buffer, verbosity):
+    if verbosity > 4:
+        log(LOG_INFO, 'rx ACK CMD_TOGGLE_LASER (off)')
+    return ACK
+
+
+def _rx_set_mode(buffer, verbosity):
+    mode = buffer[3]
+    name = _MODE_NAMES.get(mode)
+    if name is None:
+        log(LOG_WARNING, 'rx ACK CMD_SET_MODE unknown mode {:02x}', mode)
+    elif verbosity > 4:
+        log(LOG_INFO, 'rx ACK CMD_SET_MODE {}', name)
+    return mode
+
+
+def _rx_read_eeprom(buffer, verbosity):
+    addr = buffer[4]
+    data = buffer[5]
+    if verbosity > 4:
+        log(LOG_INFO, 'rx CMD_READ_EEPROM response address {:02x} data {:02x}', addr, data)
+    return EepromData(addr, data)
+
+
+def _rx_write_eeprom(buffer, verbosity):
+    sub_command = buffer[3]
+    if sub_command != 0x00:
+        log(LOG_WARNING, 'rx CMD_WRITE_EEPROM response unhandled subcommand {:02x} in {}', sub_command,
+            _Hexes(buffer))
+        return None
+    addr = buffer[4]
+    if verbosity > 4:
+        log(LOG_INFO, 'rx CMD_WRITE_EEPROM response {:02x}', addr)
+    return addr
+
+
+def _rx_reading(buffer, verbosity):
+    reading = decode_reading(buffer)
+    if reading is None:
+        log(LOG_WARNING, 'rx CMD_READING too short: {}: {}', len(buffer), _Hexes(buffer))
+    elif reading.status == READING_OK:
+        if verbosity > 2:
+            log(LOG_INFO, 'rx CMD_READING: {} : {:5.1f} feet {} mph', _Hexes(reading.payload), reading.feet(),
+                reading.speed)
     else:
-        warn = 'unhandled command {:02x} in {}'.format(command, buffer_to_hexes(buffer))
-        print('rx {}'.format(warn))
-        result = warn
-    return command, result
-
-
-def receive_message(port, expect=16, timeouts=5):
-    msg = []
-    escaped = False
-    timeouts_left = timeouts
-    expected = expect
-    while timeouts_left > 0:
-        if expected < 1:
-            expected = 1
-        buf = port.read(expected)
-        if len(buf) != 0:
-            for b in buf:
-                # print('.{:02X}.'.format(b))
-                if len(msg) > 0 and msg[0] != START_OF_MESSAGE and b == START_OF_MESSAGE:
-                    msg.clear()
-                    msg.append(b)
-                    expected = expect - 1
-                else:
-                    if b == MESSAGE_ESCAPE:
-                        if escaped:
-                            msg.append(b)
-                            expected -= 1
-                            escaped = False
-                        else:
-                            msg.append(b)
-                            escaped = True
-                    else:
-                        expected -= 1
-                        if escaped:
-                            escaped = False
-                            msg.append(b)
-                        else:
-                            msg.append(b)
-                            if b == END_OF_MESSAGE:
-                                if expected != 0:
-                                    print('    **** expected = {}'.format(expected))
-                                    if len(msg) != expect:
-                                        msg_len = msg[1] + 4
-                                        fmt = '   received {} but expected {}, message claims {} message {} '
-                                        print(fmt.format(len(msg), expect, msg_len, buffer_to_hexes(msg)))
-                                # print('   called with {} timeouts, {} left'.format(timeouts, timeouts_left))
-                                return msg
+        log(LOG_WARNING, 'rx CMD_READING: {}', _Hexes(reading.payload))
+    return reading
+
+
+def _rx_init_spd23(buffer, verbosity):
+    start = 3
+    while buffer[start] < 0x20:
+        start += 1
+    stuff = bytes(buffer[start:-2])
+    if verbosity > 3:
+        log(LOG_INFO, 'rx CMD_INIT_SPD23 text payload follows:\n{}', stuff)
+    return stuff
+
+
+def _rx_init_spd4(buffer, verbosity):
+    if verbosity > 3:
+        log(LOG_INFO, 'rx CMD_INIT_SPD4 text payload follows:\n{}', _Hexdump(buffer[3:-2]))
+    return bytes(buffer[3:-2])
+
+
+register_rx_handler(CMD_EXIT_REMOTE, _rx_exit_remote)
+register_rx_handler(CMD_READ_RAM, _rx_read_ram)
+register_rx_handler(CMD_ENABLE_REMOTE, _rx_enable_remote)
+register_rx_handler(CMD_TOGGLE_LASER, _rx_toggle_laser)
+register_rx_handler(CMD_SET_MODE, _rx_set_mode)
+register_rx_handler(CMD_READ_EEPROM, _rx_read_eeprom)
+register_rx_handler(CMD_WRITE_EEPROM, _rx_write_eeprom)
+register_rx_handler(CMD_READING, _rx_reading)
+register_rx_handler(CMD_INIT_SPD23, _rx_init_spd23)
+register_rx_handler(CMD_INIT_SPD4, _rx_init_spd4)
+
+
+def _port_decoder(port):
+    decoder = _receive_decoders.get(port)
+    if decoder is None:
+        decoder = FrameDecoder()
+        _receive_decoders[port] = decoder
+    return decoder
+
+
+RECEIVE_MARGIN_MS = 10  # allowance for OS and USB serial adapter latency
+INITIAL_TURNAROUND_MS = 20  # device turnaround guess until one has been measured
+RESET_TIMEOUT_MS = 5000  # the gun runs its self test before it answers a reset
+
+
+class _PortTiming:
+    """
+    when the last command was sent on a port, and the moving average of the device turnaround time.
+    """
+    __slots__ = ('sent_ticks', 'sent_bytes', 'sent_command', 'turnaround_ms')
+
+    def __init__(self):
+        self.sent_ticks = 0
+        self.sent_bytes = 0
+        self.sent_command = None
+        self.turnaround_ms = INITIAL_TURNAROUND_MS
+
+
+_port_timings = {}
+
+
+def _port_timing(port):
+    timing = _port_timings.get(port)
+    if timing is None:
+        timing = _PortTiming()
+        _port_timings[port] = timing
+    return timing
+
+
+def wire_time_ms(baudrate, length):
+    """
+    milliseconds to send length bytes at baudrate, 10 bits per byte.
+    """
+    return (length * 10000 + baudrate - 1) // baudrate
+
+
+def response_timeout_ms(port, expect):
+    """
+    how long to wait for an expect byte response: its wire time plus twice the learned turnaround time.
+    """
+    return wire_time_ms(port.baudrate, expect) + int(2 * _port_timing(port).turnaround_ms) + RECEIVE_MARGIN_MS
+
+
+def _learn_turnaround(port, frame):
+    timing = _port_timings.get(port)
+    if timing is None or timing.sent_command != frame[2]:
+        return  # not the response to the last command sent, maybe a reading.
+    elapsed = ticks_diff(ticks_ms(), timing.sent_ticks)
+    sample = elapsed - wire_time_ms(port.baudrate, timing.sent_bytes + len(frame))
+    if sample < 0:
+        sample = 0
+    timing.turnaround_ms += (sample - timing.turnaround_ms) * 0.25
+    timing.sent_command = None
+
+
+def receive_message(port, expect=16, timeout_ms=None):
+    """
+    receive one frame from port.  returns the unescaped, checksum-verified frame as soon as it is complete,
+    or empty bytes if it did not arrive within timeout_ms, by default response_timeout_ms(port, expect).
+    bytes received after the frame are kept by the port's decoder for the next call.
+    """
+    decoder = _port_decoder(port)
+    if timeout_ms is None:
+        timeout_ms = response_timeout_ms(port, expect)
+    deadline = ticks_add(ticks_ms(), timeout_ms)
+    buf = bytearray(expect if expect > 1 else 1)
+    buf_mv = memoryview(buf)
+    received = 0
+    n = 0  # first pass looks for a frame left over from the last call
+    while True:
+        for frame in decoder.feed(buf, n):
+            if len(frame) != expect:
+                fmt = '   received {} but expected {}, message claims {} message {} '
+                log(LOG_WARNING, fmt, len(frame), expect, frame[1] + 4, _Hexes(frame))
+            _learn_turnaround(port, frame)
+            return bytes(frame)
+        if ticks_diff(deadline, ticks_ms()) <= 0:
+            break
+        wanted = expect - received
+        if wanted < 1:
+            wanted = 1
+        n = port.readinto(buf_mv[:wanted])
+        if n > 0:
+            received += n
         else:
-            timeouts_left -= 1
-            # print('   still listening... received {} {} wanted {} left'.format(len(msg), expect, timeouts_left))
-    print('   timed out! called with {} timeouts, {} left'.format(timeouts, timeouts_left), file=sys.stderr)
-    return msg
+            time.sleep(0.001)  # do not spin on ports opened with timeout=0
+    log(LOG_WARNING, '   timed out after {} ms', timeout_ms)
+    return b''
+
+
+_check_buffer = memoryview(bytearray(MAX_MESSAGE_LENGTH))
 
 
 def validate_checksum(name, buffer):
+    """
+    unescape buffer and check its checksum.
+    returns the unescaped frame, a memoryview that is only good until the next call, or None if it is bad.
+    """
     if len(buffer) < 5:
-        print('buffer is too short to checksum: {}'.format(buffer_to_hexes(buffer)))
-        return False
-    buffer = _unescape_message(buffer)
-    checksum = 0
-    for b in buffer[1:-2]:
-        checksum = (checksum + b) & 0x00ff
-    if checksum == buffer[-2]:
-        return True
-    else:
-        print()
-        print('---------------------------------------------------------------------------------------')
-        print('{} checksum mismatch, calculated {:02x} got {:02x}!'.format(name, checksum, buffer[-2]))
-        print(hexdump_buffer(buffer))
-        print('---------------------------------------------------------------------------------------')
-        return False
+        log(LOG_WARNING, '{} buffer is too short to checksum: {}', name, _Hexes(buffer))
+        return None
+    if isinstance(buffer, (memoryview, list)):
+        buffer = bytes(buffer)  # unescape_frame needs to find() in it.
+    frame, checksum = unescape_frame(_check_buffer, buffer)
+    if checksum is None:
+        log(LOG_WARNING, '{} message too short: {}: {}', name, len(frame), _Hexes(frame))
+        return None
+    if checksum != frame[-2]:
+        log(LOG_WARNING, _CHECKSUM_MISMATCH, name, checksum, frame[-2], _Hexdump(frame))
+        return None
+    return frame
+
+
+_tx_buffer = memoryview(bytearray(MAX_MESSAGE_LENGTH))
+
+# prebuilt messages for the commands that never change.
+MESSAGE_ENABLE_REMOTE = bytes(_build_message([CMD_ENABLE_REMOTE]))
+MESSAGE_EXIT_REMOTE = bytes(_build_message([CMD_EXIT_REMOTE]))
+MESSAGE_RESET = bytes(_build_message([CMD_RESET]))
+MESSAGE_TOGGLE_LASER = bytes(_build_message([CMD_TOGGLE_LASER]))
+MESSAGE_WHO_ARE_YOU = bytes(_build_message([CMD_WHO_ARE_YOU]))
+MODE_MESSAGES = {
+    MODE_SPEED: bytes(_build_message([CMD_SET_MODE, MODE_SPEED])),
+    MODE_RANGE: bytes(_build_message([CMD_SET_MODE, MODE_RANGE])),
+    MODE_RTR: bytes(_build_message([CMD_SET_MODE, MODE_RTR])),
+}
+
+# templates for the eeprom messages, only the address, data and checksum bytes change.
+# 02 02 0b aa cc 03
+_read_ee_message = bytearray(_build_message([CMD_READ_EEPROM, 0x00]))
+# 02 04 0c 80 aa dd cc 03
+_write_ee_message = bytearray(_build_message([CMD_WRITE_EEPROM, 0x80, 0x00, 0x00]))
+
+
+def _send_message(port, message, verbosity=0):
+    if verbosity >= 4:
+        process_tx_buffer(message, verbosity=verbosity)
+    timing = _port_timing(port)
+    timing.sent_command = message[2]
+    timing.sent_bytes = len(message)
+    port.write(message)
+    timing.sent_ticks = ticks_ms()
 
 
 def send_cmd(port, msg, verbosity=0):
-    cmd = _build_message(msg)
-    process_tx_buffer(cmd, verbosity=verbosity)
-    port.write(cmd)
+    _send_message(port, _tx_buffer[:build_into(_tx_buffer, msg)], verbosity=verbosity)
 
 
 def enable_remote(port, verbosity=0):
-    send_cmd(port, [CMD_ENABLE_REMOTE], verbosity=verbosity)
+    _send_message(port, MESSAGE_ENABLE_REMOTE, verbosity=verbosity)
     return 5
 
 
 def read_ee(port, address, verbosity=0):
-    send_cmd(port, [CMD_READ_EEPROM, address], verbosity=verbosity)
+    checksum = (2 + CMD_READ_EEPROM + address) & 0x00ff
+    if _ESCAPE_TABLE[address] or _ESCAPE_TABLE[checksum]:
+        send_cmd(port, [CMD_READ_EEPROM, address], verbosity=verbosity)
+    else:
+        msg = _read_ee_message
+        msg[3] = address
+        msg[4] = checksum
+        _send_message(port, msg, verbosity=verbosity)
     return 8
 
 
 def exit_remote(port, verbosity=0):
-    send_cmd(port, [CMD_EXIT_REMOTE], verbosity=verbosity)
+    _send_message(port, MESSAGE_EXIT_REMOTE, verbosity=verbosity)
     return 5
 
 
 def reset(port, verbosity=0):
-    send_cmd(port, [CMD_RESET], verbosity=verbosity)
+    _send_message(port, MESSAGE_RESET, verbosity=verbosity)
     return 160
 
 
 def set_mode(port, mode, verbosity=0):
-    send_cmd(port, [CMD_SET_MODE, mode], verbosity=verbosity)
+    msg = MODE_MESSAGES.get(mode)
+    if msg is None:
+        send_cmd(port, [CMD_SET_MODE, mode], verbosity=verbosity)
+    else:
+        _send_message(port, msg, verbosity=verbosity)
     return 5
 
 
 def toggle_laser(port, verbosity=0):
-    send_cmd(port, [CMD_TOGGLE_LASER], verbosity=verbosity)
+    _send_message(port, MESSAGE_TOGGLE_LASER, verbosity=verbosity)
     return 5
 
 
 def write_ee(port, address, data, verbosity=0):
-    send_cmd(port, [CMD_WRITE_EEPROM, 0x80, address, data], verbosity=verbosity)
+    checksum = (4 + CMD_WRITE_EEPROM + 0x80 + address + data) & 0x00ff
+    if _ESCAPE_TABLE[address] or _ESCAPE_TABLE[data] or _ESCAPE_TABLE[checksum]:
+        send_cmd(port, [CMD_WRITE_EEPROM, 0x80, address, data], verbosity=verbosity)
+    else:
+        msg = _write_ee_message
+        msg[4] = address
+        msg[5] = data
+        msg[6] = checksum
+        _send_message(port, msg, verbosity=verbosity)
     return 8
 
 
-def receive_response(port, expect=16, timeouts=1, verbosity=5):
+def receive_response(port, expect=16, timeout_ms=None, verbosity=5):
     if expect > 0:
-        msg = receive_message(port, expect=expect, timeouts=timeouts)
+        msg = receive_message(port, expect=expect, timeout_ms=timeout_ms)
         if len(msg) == 0:
             return None, None
         else:
-            return process_rx_buffer(msg, verbosity=verbosity)
+            return process_rx_frame(msg, verbosity=verbosity)
     else:
         return None, None
 
+
+_eeprom_images = {}
+EEPROM_READ_WINDOW = 8  # read commands kept outstanding by read_eeprom_image()
+
+
+def _read_eeprom_pass(port, data, addresses, window, timeout_ms, verbosity):
+    """
+    pipelined read of addresses into data.  returns the addresses that did not answer.
+    """
+    decoder = _port_decoder(port)
+    buf = bytearray(8 * window)
+    buf_mv = memoryview(buf)
+    outstanding = set()
+    failed = []
+    next_address = 0
+    if timeout_ms is None:
+        timeout_ms = response_timeout_ms(port, 8 * window)
+    deadline = ticks_add(ticks_ms(), timeout_ms)
+    n = 0
+    while next_address < len(addresses) or len(outstanding) > 0:
+        while next_address < len(addresses) and len(outstanding) < window:
+            address = addresses[next_address]
+            read_ee(port, address, verbosity=verbosity)
+            outstanding.add(address)
+            next_address += 1
+        for frame in decoder.feed(buf, n):
+            if frame[2] == CMD_READ_EEPROM and len(frame) >= 8:
+                address = frame[4]
+                if address in outstanding:
+                    outstanding.discard(address)
+                    data[address] = frame[5]
+        n = port.readinto(buf_mv[:8 * len(outstanding)]) if len(outstanding) > 0 else 0
+        if n > 0:
+            deadline = ticks_add(ticks_ms(), timeout_ms)
+        elif len(outstanding) > 0:
+            if ticks_diff(deadline, ticks_ms()) <= 0:
+                # give up on these for this pass and keep the rest moving.
+                failed.extend(outstanding)
+                outstanding.clear()
+                deadline = ticks_add(ticks_ms(), timeout_ms)
+            else:
+                time.sleep(0.001)
+    return sorted(failed)
+
+
+def read_eeprom_image(port, refresh=False, retries=3, window=EEPROM_READ_WINDOW, timeout_ms=None, verbosity=0):
+    """
+    read the whole eeprom, keeping up to window reads outstanding, and retrying only the addresses that failed.
+    returns an EepromImage, or None if the read failed or the checksum is wrong.
+    the image is cached per port, and returned without touching the port unless refresh is True.
+    """
+    image = _eeprom_images.get(port)
+    if image is not None and not refresh:
+        return image
+    data = bytearray(EEPROM_LENGTH)
+    missing = list(range(EEPROM_LENGTH))
+    tries = 0
+    while len(missing) > 0 and tries <= retries:
+        if tries > 0:
+            log(LOG_WARNING, 'retrying {} eeprom addresses', len(missing))
+        missing = _read_eeprom_pass(port, data, missing, window, timeout_ms, verbosity)
+        tries += 1
+    if len(missing) > 0:
+        log(LOG_ERROR, 'eeprom read failed, no response for {} addresses', len(missing))
+        return None
+    image = EepromImage(data)
+    if not image.checksum_ok():
+        log(LOG_ERROR, 'eeprom checksum mismatch: calculated {:02x}, read {:02x}', eeprom_checksum(data),
+            data[EEPROM_CHECKSUM_ADDRESS])
+        return None
+    _eeprom_images[port] = image
+    return image
+
+
+BAUD_RATES = (19200, 9600, 4800)  # fastest first
+_port_baud_rates = {}
+
+
+def autodetect_baud(port, rates=BAUD_RATES, refresh=False, timeout_ms=None, verbosity=0):
+    """
+    find the gun's baud rate by reading the eeprom magic byte at each rate in turn.
+    the port is left at the rate found, which is cached per port.  returns the rate, or None if nothing answered.
+    """
+    baudrate = _port_baud_rates.get(port)
+    if baudrate is not None and not refresh:
+        if port.baudrate != baudrate:
+            port.set_baudrate(baudrate)
+        return baudrate
+    original = port.baudrate
+    for baudrate in rates:
+        port.set_baudrate(baudrate)
+        decoder = _port_decoder(port)
+        for attempt in range(2):  # the first command after a rate change can be lost
+            decoder.reset()
+            expect = read_ee(port, EEPROM_MAGIC_ADDRESS, verbosity=verbosity)
+            cmd, result = receive_response(port, expect=expect, timeout_ms=timeout_ms, verbosity=verbosity)
+            if cmd == CMD_READ_EEPROM and result.address == EEPROM_MAGIC_ADDRESS and result.data == EEPROM_MAGIC:
+                log(LOG_INFO, 'gun found at {} baud', baudrate)
+                _port_baud_rates[port] = baudrate
+                return baudrate
+    port.set_baudrate(original)
+    log(LOG_ERROR, 'no response at {} baud', rates)
+    return None
+
+
+def upgrade_baud(port, baudrate=BAUD_RATES[0], verbosity=0):
+    """
+    reprogram the gun to use baudrate, reset it, and switch the port to match.
+    returns the rate the gun is using afterwards, or None if it was lost.
+    """
+    current = autodetect_baud(port, verbosity=verbosity)
+    if current is None or current == baudrate:
+        return current
+    image = read_eeprom_image(port, refresh=True, verbosity=verbosity)
+    if image is None:
+        return current
+    old = bytes(image.data)
+    image.set('baud_rate', baudrate)
+    expect = enable_remote(port, verbosity=verbosity)
+    receive_response(port, expect=expect, verbosity=verbosity)
+    for address in range(EEPROM_LENGTH):
+        if image[address] != old[address]:
+            expect = write_ee(port, address, image[address], verbosity=verbosity)
+            cmd, result = receive_response(port, expect=expect, verbosity=verbosity)
+            if cmd != CMD_WRITE_EEPROM or result != address:
+                log(LOG_ERROR, 'baud rate change failed writing eeprom address {:02x}', address)
+                expect = exit_remote(port, verbosity=verbosity)
+                receive_response(port, expect=expect, verbosity=verbosity)
+                return current
+    expect = exit_remote(port, verbosity=verbosity)
+    receive_response(port, expect=expect, verbosity=verbosity)
+    reset(port, verbosity=verbosity)
+    time.sleep(1.0)  # let the gun restart, the init message is sent at the old or new rate, ignore it
+    _port_decoder(port).reset()
+    _eeprom_images.pop(port, None)
+    detected = autodetect_baud(port, rates=(baudrate, current), refresh=True, verbosity=verbosity)
+    if detected == baudrate:
+        _eeprom_images[port] = image
+    return detected
@@ -0,0 +1,208 @@
+#
+# pipelined Prolaser III command session.
+# runs on both cpython asyncio and micropython uasyncio.
+#
+# commands are written as soon as there is room in the window of outstanding commands, so bulk operations
+# run at the serial line rate instead of one round trip per command.  responses are matched to commands by
+# command byte and eeprom address.  the receiver task must hand every decoded rx frame to dispatch().
+#
+import sys
+
+import pl3
+
+if sys.implementation.name == 'micropython':
+    import uasyncio as asyncio
+else:
+    import asyncio
+
+DEFAULT_WINDOW = 8
+DEFAULT_TIMEOUT_MS = 250
+
+
+class PendingCommand:
+    """
+    a command waiting for its response.  await wait() to get the decoded result.
+    wait() raises asyncio.TimeoutError if no response arrived before the deadline.
+    """
+    __slots__ = ('session', 'key', 'payload', 'timeout_ms', 'deadline', 'event', 'result', 'timed_out')
+
+    def __init__(self, session, key, payload, timeout_ms):
+        self.session = session
+        self.key = key
+        self.payload = payload
+        self.timeout_ms = timeout_ms
+        self.deadline = None  # set when the command is sent
+        self.event = asyncio.Event()
+        self.result = None
+        self.timed_out = False
+
+    def done(self):
+        return self.event.is_set()
+
+    def _finish(self, result, timed_out=False):
+        self.result = result
+        self.timed_out = timed_out
+        self.event.set()
+
+    async def wait(self):
+        session = self.session
+        while not self.event.is_set():
+            deadline = self.deadline if self.deadline is not None else session.next_deadline()
+            if deadline is None:
+                remaining = self.timeout_ms
+            else:
+                remaining = pl3.ticks_diff(deadline, pl3.ticks_ms())
+            try:
+                await asyncio.wait_for(self.event.wait(), max(remaining, 1) / 1000)
+            except asyncio.TimeoutError:
+                session.expire()
+        if self.timed_out:
+            raise asyncio.TimeoutError('no response to command {:02x}'.format(self.key[0]))
+        return self.result
+
+
+class Pl3Session:
+    def __init__(self, port, window=DEFAULT_WINDOW, timeout_ms=DEFAULT_TIMEOUT_MS, verbosity=0):
+        self.port = port
+        self.window = window
+        self.timeout_ms = timeout_ms
+        self.verbosity = verbosity
+        self.timeouts = 0
+        self.eeprom_image = None
+        self._in_flight = []
+        self._queued = []
+
+    def submit(self, payload, key, timeout_ms=None):
+        """
+        queue a command.  payload is the unescaped message payload, key is (response command, address or None).
+        returns a PendingCommand.
+        """
+        pending = PendingCommand(self, key, payload, self.timeout_ms if timeout_ms is None else timeout_ms)
+        self._queued.append(pending)
+        self.expire()
+        self._send_queued()
+        return pending
+
+    def dispatch(self, command, result):
+        """
+        offer a decoded rx frame, as returned by pl3.process_rx_frame(), to the outstanding commands.
+        returns True if it was the response to one of them.
+        """
+        if command == pl3.CMD_READ_EEPROM:
+            key = (command, result.address)
+        elif command == pl3.CMD_WRITE_EEPROM:
+            key = (command, result)
+        elif command == pl3.CMD_INIT_SPD4:
+            key = (pl3.CMD_INIT_SPD23, None)
+        else:
+            key = (command, None)
+        for i in range(len(self._in_flight)):
+            pending = self._in_flight[i]
+            if pending.key == key:
+                del self._in_flight[i]
+                pending._finish(result)
+                self._send_queued()
+                return True
+        return False
+
+    def expire(self):
+        """
+        fail the outstanding commands that are past their deadline.
+        """
+        now = pl3.ticks_ms()
+        i = 0
+        expired = False
+        while i < len(self._in_flight):
+            pending = self._in_flight[i]
+            if pl3.ticks_diff(pending.deadline, now) <= 0:
+                del self._in_flight[i]
+                self.timeouts += 1
+                pl3.log(pl3.LOG_WARNING, 'no response to {}', pl3._Hexes(pending.payload))
+                pending._finish(None, timed_out=True)
+                expired = True
+            else:
+                i += 1
+        if expired:
+            self._send_queued()
+
+    def next_deadline(self):
+        """
+        the earliest deadline of the outstanding commands, or None if there are none.
+        """
+        deadline = None
+        for pending in self._in_flight:
+            if deadline is None or pl3.ticks_diff(pending.deadline, deadline) < 0:
+                deadline = pending.deadline
+        return deadline
+
+    def outstanding(self):
+        return len(self._in_flight) + len(self._queued)
+
+    def _send_queued(self):
+        while len(self._queued) > 0 and len(self._in_flight) < self.window:
+            pending = self._queued.pop(0)
+            pending.deadline = pl3.ticks_add(pl3.ticks_ms(), pending.timeout_ms)
+            self._in_flight.append(pending)
+            pl3.send_cmd(self.port, pending.payload, verbosity=self.verbosity)
+
+    # command helpers.  each returns a PendingCommand.
+
+    def enable_remote(self):
+        return self.submit([pl3.CMD_ENABLE_REMOTE], (pl3.CMD_ENABLE_REMOTE, None))
+
+    def exit_remote(self):
+        return self.submit([pl3.CMD_EXIT_REMOTE], (pl3.CMD_EXIT_REMOTE, None))
+
+    def set_mode(self, mode):
+        return self.submit([pl3.CMD_SET_MODE, mode], (pl3.CMD_SET_MODE, None))
+
+    def read_ee(self, address):
+        return self.submit([pl3.CMD_READ_EEPROM, address], (pl3.CMD_READ_EEPROM, address))
+
+    def write_ee(self, address, data):
+        return self.submit([pl3.CMD_WRITE_EEPROM, 0x80, address, data], (pl3.CMD_WRITE_EEPROM, address))
+
+    def reset(self):
+        return self.submit([pl3.CMD_RESET], (pl3.CMD_INIT_SPD23, None), pl3.RESET_TIMEOUT_MS)
+
+    async def read_ee_many(self, addresses):
+        """
+        read a list of eeprom addresses.  returns a dict of address: data for the ones that answered.
+        """
+        pending = [self.read_ee(address) for address in addresses]
+        results = {}
+        for p in pending:
+            try:
+                result = await p.wait()
+                results[result.address] = result.data
+            except asyncio.TimeoutError:
+                pass
+        return results
+
+    async def read_eeprom_image(self, refresh=False, retries=3):
+        """
+        read the whole eeprom like pl3.read_eeprom_image(), retrying only the addresses that did not answer.
+        returns a pl3.EepromImage, or None if the read failed or the checksum is wrong.
+        the image is kept in eeprom_image and returned from there unless refresh is True.
+        """
+        if self.eeprom_image is not None and not refresh:
+            return self.eeprom_image
+        data = bytearray(pl3.EEPROM_LENGTH)
+        missing = list(range(pl3.EEPROM_LENGTH))
+        tries = 0
+        while len(missing) > 0 and tries <= retries:
+            results = await self.read_ee_many(missing)
+            for address in results:
+                data[address] = results[address]
+            missing = [address for address in missing if address not in results]
+            tries += 1
+        if len(missing) > 0:
+            pl3.log(pl3.LOG_ERROR, 'eeprom read failed, no response for {} addresses', len(missing))
+            return None
+        image = pl3.EepromImage(data)
+        if not image.checksum_ok():
+            pl3.log(pl3.LOG_ERROR, 'eeprom checksum mismatch: calculated {:02x}, read {:02x}',
+                    pl3.eeprom_checksum(data), data[pl3.EEPROM_CHECKSUM_ADDRESS])
+            return None
+        self.eeprom_image = image
+        return image
@@ -0,0 +1,68 @@
+#
+# fixed size log of received messages for the web server.
+# records are packed into one preallocated bytearray so appending is constant time and does not grow the heap.
+#
+import struct
+import time
+
+import pl3
+
+RECORD_FORMAT = '<IBBHB'  # time (seconds), command, speed, range (feet * 10), status
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)
+
+
+class ReadingLog:
+    """
+    ring buffer of the last capacity messages.  every record gets a sequence number, starting at 0 and always
+    increasing, so clients can ask for the records after the last one they saw.
+    """
+
+    def __init__(self, capacity=100):
+        self.capacity = capacity
+        self.next_seq = 0  # sequence number the next record will get
+        self._buffer = bytearray(capacity * RECORD_SIZE)
+
+    def append(self, timestamp, command, speed=0, rng=0, status=0):
+        struct.pack_into(RECORD_FORMAT, self._buffer, (self.next_seq % self.capacity) * RECORD_SIZE,
+                         timestamp, command, speed, rng, status)
+        self.next_seq += 1
+
+    def append_reading(self, timestamp, reading):
+        self.append(timestamp, pl3.CMD_READING, reading.speed, reading.range, reading.status)
+
+    def first_seq(self):
+        """
+        sequence number of the oldest record still in the log.
+        """
+        return self.next_seq - self.capacity if self.next_seq > self.capacity else 0
+
+    def get(self, seq):
+        """
+        returns record seq as (timestamp, command, speed, range, status).
+        """
+        if seq < self.first_seq() or seq >= self.next_seq:
+            raise IndexError('record {} is not in the log'.format(seq))
+        return struct.unpack_from(RECORD_FORMAT, self._buffer, (seq % self.capacity) * RECORD_SIZE)
+
+    def since(self, seq):
+        """
+        the sequence numbers after seq that are still in the log, oldest first.
+        """
+        start = seq + 1
+        first = self.first_seq()
+        if start < first:
+            start = first
+        return range(start, self.next_seq)
+
+
+def format_record(record, format_time):
+    """
+    render a record the way the web page shows it.  format_time turns a time.gmtime() tuple into a string.
+    """
+    timestamp, command, speed, rng, status = record
+    prefix = '{} {:02x}'.format(format_time(time.gmtime(timestamp)), command)
+    if command != pl3.CMD_READING:
+        return prefix
+    if status != pl3.READING_OK:
+        return '{} - status {:02x}'.format(prefix, status)
+    return '{} - {:.1f} feet {} mph'.format(prefix, rng / 10.0, speed)
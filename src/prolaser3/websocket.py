@@ -0,0 +1,115 @@
+#
+# minimal RFC 6455 websocket framing for the asyncio web server.
+# runs on both cpython asyncio and micropython uasyncio.
+#
+import binascii
+import hashlib
+import struct
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xa
+
+CLOSE_PROTOCOL_ERROR = 1002
+
+MAX_PAYLOAD = 1024  # largest message accepted from a client
+_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+
+class ProtocolError(ValueError):
+    """
+    the client broke RFC 6455, close the connection with CLOSE_PROTOCOL_ERROR.
+    """
+
+
+def accept_key(key):
+    """
+    the Sec-WebSocket-Accept value for a client's Sec-WebSocket-Key.
+    """
+    return binascii.b2a_base64(hashlib.sha1(key.encode() + _GUID).digest()).strip().decode()
+
+
+def handshake_response(key):
+    return ('HTTP/1.1 101 Switching Protocols\r\n'
+            'Upgrade: websocket\r\n'
+            'Connection: Upgrade\r\n'
+            'Sec-WebSocket-Accept: {}\r\n\r\n').format(accept_key(key)).encode()
+
+
+def build_frame(opcode, payload=b''):
+    """
+    a complete, unmasked server frame.
+    """
+    n = len(payload)
+    if n < 126:
+        header = struct.pack('!BB', 0x80 | opcode, n)
+    elif n < 65536:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, n)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, n)
+    return header + payload
+
+
+async def _read_frame(reader, max_payload):
+    header = await reader.readexactly(2)
+    fin = header[0] & 0x80 != 0
+    opcode = header[0] & 0x0f
+    if header[1] & 0x80 == 0:
+        raise ProtocolError('websocket client frame is not masked')
+    n = header[1] & 0x7f
+    if opcode >= OP_CLOSE and (not fin or n > 125):
+        raise ProtocolError('websocket control frame is fragmented or too big')
+    if n == 126:
+        n = struct.unpack('!H', await reader.readexactly(2))[0]
+    elif n == 127:
+        n = struct.unpack('!Q', await reader.readexactly(8))[0]
+    if n > max_payload:
+        raise ValueError('websocket frame too big: {}'.format(n))
+    mask = await reader.readexactly(4)
+    payload = bytearray(await reader.readexactly(n)) if n > 0 else bytearray()
+    for i in range(n):
+        payload[i] ^= mask[i & 3]
+    return fin, opcode, payload
+
+
+class MessageReader:
+    """
+    reads the messages from a client, joining fragments.  control frames are returned as they arrive, a message
+    they interrupt is kept until its last fragment.
+    """
+
+    def __init__(self, reader, max_payload=MAX_PAYLOAD):
+        self.reader = reader
+        self.max_payload = max_payload
+        self._message = None  # the fragments so far
+        self._opcode = OP_TEXT
+
+    async def read(self):
+        """
+        returns the next (opcode, payload).  end of stream is returned as OP_CLOSE.
+        """
+        try:
+            while True:
+                fin, opcode, payload = await _read_frame(self.reader, self.max_payload)
+                if opcode >= OP_CLOSE:
+                    return opcode, payload
+                if opcode != OP_CONTINUATION:
+                    if self._message is not None:
+                        raise ProtocolError('websocket message started before the last one ended')
+                    self._opcode = opcode
+                    self._message = payload
+                elif self._message is None:
+                    raise ProtocolError('websocket continuation without a message')
+                else:
+                    self._message += payload
+                    if len(self._message) > self.max_payload:
+                        raise ValueError('websocket message too big: {}'.format(len(self._message)))
+                if fin:
+                    message = self._message
+                    self._message = None
+                    return self._opcode, message
+        except EOFError:
+            return OP_CLOSE, b''